@@ -11,4 +11,4 @@ python vehicle_intelligence/manage.py migrate
 
 # Start Gunicorn
 cd vehicle_intelligence
-gunicorn --bind 0.0.0.0:8000 vehicle_intelligence.wsgi:application
\ No newline at end of file
+gunicorn --bind 0.0.0.0:8000 -k uvicorn.workers.UvicornWorker vehicle_intelligence.asgi:application
\ No newline at end of file
@@ -1,83 +1,468 @@
 # ai_assistant.py
-import json
+import hashlib
+import re
+import orjson
 from django.conf import settings
+from django.core.cache import cache
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
-from .models import ParkingRecord, Organization, CustomUser
-from django.db.models import Count, Sum, Avg, Q
-from datetime import datetime, timedelta
+from .models import ParkingRecord, Organization, CustomUser, OrganizationAnalyticsRollup, OrganizationPlateVisits
+from .signals import (
+    ORGANIZATION_COUNT_CACHE_KEY, ORGANIZATION_NAMES_CACHE_KEY, USER_COUNT_CACHE_KEY,
+    ORG_USER_COUNTS_CACHE_KEY, AI_CONTEXT_VERSION_CACHE_KEY
+)
+from django.db.models import Count, Sum, Avg, Max, Q
+from django.utils import timezone
+from functools import lru_cache
+from string import Template
 import logging
 
 # Optional OpenAI import
 try:
+    import httpx
     import openai
     OPENAI_AVAILABLE = True
 except ImportError:
+    httpx = None
     openai = None
     OPENAI_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+# Seconds AI page context is reused before the aggregates are recomputed
+AI_CONTEXT_CACHE_TIMEOUT = 60
+
+# Seconds an OpenAI reply is reused for the same prompt and question
+AI_RESPONSE_CACHE_TIMEOUT = 3600
+
+# Completion parameters for chat replies and generated reports
+_CHAT_OPTIONS = {'model': 'gpt-3.5-turbo', 'max_tokens': 500, 'temperature': 0.7}
+_REPORT_OPTIONS = {'model': 'gpt-3.5-turbo', 'max_tokens': 1500, 'temperature': 0.5}
+
+# Keywords the fallback responders branch on, mapped to the intent they signal
+_KEYWORD_DISPATCH = {
+    'summary': 'summary',
+    'overview': 'summary',
+    'recommendation': 'recommend',
+    'optimize': 'recommend',
+    'performance': 'performance',
+    'users': 'users',
+    'employees': 'users',
+    'fleet': 'fleet',
+    'vehicle': 'fleet',
+    'report': 'report',
+}
+
+# All keywords matched in a single pass (substring semantics, so
+# "recommendations" still hits "recommendation")
+_INTENT_RE = re.compile('|'.join(map(re.escape, _KEYWORD_DISPATCH)), re.I)
+
+# Fallback responder per page type; anything else gets the dashboard one
+_FALLBACK_HANDLERS = {
+    'analytics': '_analytics_fallback_response',
+    'vehicle_alert': '_vehicle_fallback_response',
+    'org_admin_dashboard': '_org_admin_fallback_response',
+}
+
+# Fallback report sections, compiled once at import
+_ANALYTICS_SUMMARY_TPL = Template("""
+            EXECUTIVE SUMMARY
+            =================
+            Fleet Performance Overview for $organization
+            
+            • Total Vehicles: $total_vehicles
+            • Revenue Generated: KSh $total_revenue
+            • Average Utilization: $avg_duration minutes
+            • Performance Rating: $rating
+            """)
+
+_VEHICLE_SUMMARY_TPL = Template("""
+            VEHICLE INTELLIGENCE REPORT
+            ===========================
+            Analysis for $license_plate
+            
+            • Total Visits: $total_visits
+            • Revenue Impact: KSh $total_amount
+            • Utilization Pattern: $avg_duration min average
+            • Performance Status: $status
+            """)
+
+_REPORT_RECOMMENDATIONS = """
+        OPTIMIZATION RECOMMENDATIONS
+        ============================
+        1. Monitor peak usage patterns for capacity planning
+        2. Implement predictive maintenance schedules
+        3. Optimize pricing strategies based on demand
+        4. Enhance route efficiency through data analysis
+        5. Consider fleet expansion in high-demand areas
+        """
+
+# Context fields the system prompt reads; everything else is ignored
+_PROMPT_FIELDS = (
+    'user_role', 'organization', 'vehicle_found', 'license_plate',
+    'total_visits', 'total_amount', 'avg_duration', 'last_visit',
+    'total_vehicles', 'total_revenue', 'organization_name',
+    'organization_users', 'active_users', 'vehicle_count', 'user_type',
+    'total_organizations', 'total_users',
+)
+
+# Floats are rounded to the precision the prompt displays them at, so
+# near-identical contexts share a cache entry without changing the text
+_PROMPT_FLOAT_PRECISION = {
+    'total_revenue': 2,
+    'total_amount': 2,
+    'avg_duration': 1,
+}
+
+
+def _prompt_value(name, value):
+    """Project a context value into a hashable prompt cache key component"""
+    if isinstance(value, float) and name in _PROMPT_FLOAT_PRECISION:
+        return round(value, _PROMPT_FLOAT_PRECISION[name])
+    return value
+
+
+def context_cache_key(prefix, *parts):
+    """Cache key for AI context data, scoped to the current ParkingRecord version"""
+    version = cache.get(AI_CONTEXT_VERSION_CACHE_KEY, 0)
+    *scope, filters = parts
+    digest = hashlib.blake2b(
+        orjson.dumps(filters or {}, option=orjson.OPT_SORT_KEYS),
+        digest_size=16
+    ).hexdigest()
+    return ':'.join([prefix, str(version), *map(str, scope), digest])
+
+
+def completion_cache_key(model, system_prompt, message):
+    """Cache key for an OpenAI completion of message under system_prompt"""
+    digest = hashlib.blake2b(
+        '\0'.join([model, system_prompt, message]).encode(),
+        digest_size=16
+    ).hexdigest()
+    return f'ai_resp:{digest}'
+
+
+def _cached_count(cache_key, model):
+    """Table row count cached for a minute; signals drop it on writes"""
+    count = cache.get(cache_key)
+    if count is None:
+        count = model.objects.count()
+        cache.set(cache_key, count, 60)
+    return count
+
+
+def _organization_names():
+    """Organization id -> name map, cached until organizations change"""
+    return cache.get_or_set(
+        ORGANIZATION_NAMES_CACHE_KEY,
+        lambda: dict(Organization.objects.values_list('id', 'name')),
+        300
+    )
+
+
+def _org_user_counts(org_id):
+    """Total and active user counts for an organization, cached until its users change"""
+    cache_key = ORG_USER_COUNTS_CACHE_KEY.format(org_id)
+    counts = cache.get(cache_key)
+    if counts is None:
+        counts = CustomUser.objects.filter(organization_id=org_id).aggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(is_active=True))
+        )
+        cache.set(cache_key, counts, 300)
+    return counts
+
+
+def _compact_context(value, max_list=5):
+    """Copy context for a report prompt, capping lists and dropping None values"""
+    if isinstance(value, dict):
+        return {
+            key: _compact_context(item, max_list)
+            for key, item in value.items() if item is not None
+        }
+    if isinstance(value, (list, tuple)):
+        return [_compact_context(item, max_list) for item in value[:max_list]]
+    return value
+
+
+_PROMPT_HEADER = """You are an advanced AI assistant for a Vehicle Intelligence System. 
+    You provide detailed analytics, insights, and recommendations based on real fleet data.
+    
+    Current Context:
+    """
+
+_PROMPT_GUIDELINES = """
+    
+    Guidelines:
+    - Provide specific, actionable insights based on the data
+    - Use professional but friendly tone
+    - Include relevant metrics and comparisons
+    - Suggest optimization opportunities
+    - Keep responses concise but informative
+    - Use emojis sparingly for better readability
+    """
+
+# Per-page prompt bodies keyed by (page_type, variant); the variant is
+# vehicle_found on the alert page and "is super admin" on the dashboard
+_PROMPT_TEMPLATES = {
+    ('analytics', None): """
+        - Page: Analytics Dashboard
+        - Total Vehicles: {total_vehicles}
+        - Total Revenue: KSh {total_revenue:,.2f}
+        - Average Duration: {avg_duration:.1f} minutes
+        - User Role: {user_role}
+        - Organization: {organization}
+        
+        Provide insights on fleet performance, optimization opportunities, and data interpretation.
+        """,
+    ('vehicle_alert', True): """
+            - Page: Vehicle Alert System
+            - Vehicle: {license_plate}
+            - Total Visits: {total_visits}
+            - Total Amount: KSh {total_amount:,.2f}
+            - Average Duration: {avg_duration:.1f} minutes
+            - Last Visit: {last_visit}
+            
+            Provide vehicle-specific analysis, performance insights, and recommendations.
+            """,
+    ('vehicle_alert', False): """
+            - Page: Vehicle Alert System
+            - No vehicle currently selected
+            
+            Help with vehicle search and explain system capabilities.
+            """,
+    ('org_admin_dashboard', None): """
+        - Page: Organization Admin Dashboard
+        - Organization: {organization_name}
+        - Total Users: {organization_users}
+        - Active Users: {active_users}
+        - Fleet Vehicles: {vehicle_count}
+        - Fleet Revenue: KSh {total_revenue:,.2f}
+        - Average Parking Duration: {avg_duration:.1f} minutes
+        - User Role: Organization Administrator
+        
+        Provide organization management insights, user analytics, fleet performance analysis, and administrative recommendations.
+        """,
+    ('dashboard', True): """
+            - Page: Super Admin Dashboard
+            - Total Organizations: {total_organizations}
+            - Total Users: {total_users}
+            - User Role: Super Administrator
+            
+            Provide system-wide insights, organizational comparisons, and strategic recommendations.
+            """,
+    ('dashboard', False): """
+            - Page: User Dashboard
+            - User Role: {user_role}
+            - Organization: {organization}
+            
+            Provide user-specific insights and system navigation help.
+            """,
+}
+
+# Values shown when a context field is missing
+_PROMPT_DEFAULTS = {
+    'total_vehicles': 'N/A',
+    'organization_name': 'N/A',
+    'total_revenue': 0,
+    'total_amount': 0,
+    'avg_duration': 0,
+    'total_visits': 0,
+    'organization_users': 0,
+    'active_users': 0,
+    'vehicle_count': 0,
+    'total_organizations': 0,
+    'total_users': 0,
+}
+
+
+def _report_prompt(context, report_type):
+    """Prompt asking the model for a structured report over the compacted context"""
+    return f"""
+            Generate a comprehensive {report_type} report based on this vehicle intelligence data:
+            {orjson.dumps(_compact_context(context), default=str).decode()}
+            
+            Include:
+            1. Executive Summary
+            2. Key Performance Indicators
+            3. Trend Analysis
+            4. Optimization Recommendations
+            5. Predictive Insights
+            6. Action Items
+            
+            Format as structured text suitable for PDF generation.
+            """
+
+
+@lru_cache(maxsize=256)
+def _prompt_for(page_type, fields):
+    """Render the system prompt for a page type from hashable context fields"""
+    context = dict(fields)
+    if page_type == 'vehicle_alert':
+        variant = bool(context.get('vehicle_found'))
+    elif page_type == 'dashboard':
+        variant = context.get('user_type') == 'super_admin'
+    else:
+        variant = None
+    
+    template = _PROMPT_TEMPLATES.get((page_type, variant), '')
+    return _PROMPT_HEADER + template.format_map({**_PROMPT_DEFAULTS, **context}) + _PROMPT_GUIDELINES
+
+
 class AIAssistant:
-    def __init__(self):
-        # Initialize OpenAI client when API key is available
-        self.client = None
-        if OPENAI_AVAILABLE and hasattr(settings, 'OPENAI_API_KEY') and settings.OPENAI_API_KEY:
-            openai.api_key = settings.OPENAI_API_KEY
-            self.client = openai
+    # Single pooled OpenAI clients shared by every instance, created on first use
+    _shared_client = None
+    _shared_async_client = None
+
+    @staticmethod
+    def _pool_options():
+        return {
+            'limits': httpx.Limits(max_keepalive_connections=20, max_connections=40),
+            'timeout': httpx.Timeout(30.0, connect=5.0),
+        }
+
+    @classmethod
+    def get_client(cls):
+        """Return the shared OpenAI client, or None when no API key is configured"""
+        if cls._shared_client is None and OPENAI_AVAILABLE and getattr(settings, 'OPENAI_API_KEY', None):
+            cls._shared_client = openai.OpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                # Failed calls drop to the local fallback rather than retrying with backoff
+                max_retries=0,
+                http_client=httpx.Client(
+                    transport=httpx.HTTPTransport(retries=1),
+                    **cls._pool_options()
+                )
+            )
+        return cls._shared_client
+
+    @classmethod
+    def get_async_client(cls):
+        """Return the shared AsyncOpenAI client, or None when no API key is configured"""
+        if cls._shared_async_client is None and OPENAI_AVAILABLE and getattr(settings, 'OPENAI_API_KEY', None):
+            cls._shared_async_client = openai.AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    transport=httpx.AsyncHTTPTransport(retries=1),
+                    **cls._pool_options()
+                )
+            )
+        return cls._shared_async_client
+
+    @property
+    def client(self):
+        return self.get_client()
 
     def get_context_data(self, user, page_type, filters=None):
         """Get relevant data context for AI analysis"""
+        # Resolve the organization once; the helpers reuse the name rather than re-reading the FK
+        org_name = user.organization.name if user.organization_id else None
         context = {
             'user_role': user.role,
-            'organization': user.organization.name if user.organization else 'System',
-            'page_type': page_type,
-            'timestamp': datetime.now().isoformat()
+            'organization': org_name or 'System',
+            'page_type': page_type
         }
         
-        if page_type == 'analytics':
-            context.update(self._get_analytics_context(user, filters))
-        elif page_type == 'vehicle_alert':
-            context.update(self._get_vehicle_context(user, filters))
-        elif page_type == 'dashboard' or page_type == 'org_admin_dashboard':
-            context.update(self._get_dashboard_context(user))
-            
+        # Page data is cached briefly so follow-up questions on the same view skip the aggregates
+        cache_key = context_cache_key('ai_ctx', user.organization_id, user.role, page_type, filters)
+        page_context = cache.get(cache_key)
+        if page_context is None:
+            page_context = {}
+            if page_type == 'analytics':
+                page_context = self._get_analytics_context(user, org_name, filters)
+            elif page_type == 'vehicle_alert':
+                page_context = self._get_vehicle_context(user, filters)
+            elif page_type == 'dashboard' or page_type == 'org_admin_dashboard':
+                page_context = self._get_dashboard_context(user, org_name)
+            cache.set(cache_key, page_context, AI_CONTEXT_CACHE_TIMEOUT)
+        
+        context.update(page_context)
         return context
 
-    def _get_analytics_context(self, user, filters):
+    def _get_analytics_context(self, user, org_name, filters):
         """Get analytics-specific context"""
+        # Users outside any organization have no records to analyse
+        if user.role != 'super_admin' and not org_name:
+            return {
+                'total_vehicles': 0,
+                'total_revenue': 0.0,
+                'avg_duration': 0.0,
+                'top_organizations': [],
+                'record_count': 0
+            }
+        
+        filters = filters or {}
+        
+        # Organization names the records are restricted to (all must match)
+        org_scope = []
+        if user.role != 'super_admin' and org_name:
+            org_scope.append(org_name)
+        if filters.get('organization'):
+            org_scope.append(_organization_names().get(int(filters['organization'])))
+        
         queryset = ParkingRecord.objects.all()
+        for scope_name in org_scope:
+            queryset = queryset.filter(organization=scope_name)
+        
+        # Without brand/type filters the per-organization rollups already hold every total
+        if not filters.get('vehicle_brand') and not filters.get('vehicle_type'):
+            rollups = OrganizationAnalyticsRollup.objects.all()
+            for scope_name in org_scope:
+                rollups = rollups.filter(organization=scope_name)
+            
+            totals = rollups.aggregate(
+                vehicle_count=Sum('vehicle_count'),
+                total_revenue=Sum('total_revenue'),
+                total_duration_minutes=Sum('total_duration_minutes'),
+                duration_count=Sum('duration_count'),
+                record_count=Sum('record_count')
+            )
+            
+            if org_scope:
+                total_vehicles = totals['vehicle_count'] or 0
+            else:
+                # Vehicles that visit several organizations must only be counted once
+                total_vehicles = OrganizationPlateVisits.objects.filter(visits__gt=0).values('plate_number').distinct().count()
+            
+            duration_count = totals['duration_count'] or 0
+            top_orgs = list(rollups.order_by('-total_revenue').values('organization', 'vehicle_count', 'total_revenue')[:5])
+            
+            return {
+                'total_vehicles': total_vehicles,
+                'total_revenue': float(totals['total_revenue'] or 0),
+                'avg_duration': float(totals['total_duration_minutes'] or 0) / duration_count if duration_count else 0.0,
+                'top_organizations': top_orgs,
+                'record_count': totals['record_count'] or 0
+            }
         
-        if user.role != 'super_admin' and user.organization:
-            queryset = queryset.filter(organization=user.organization)
-            
-        if filters:
-            if filters.get('organization'):
-                queryset = queryset.filter(organization_id=filters['organization'])
-            if filters.get('vehicle_brand'):
-                queryset = queryset.filter(vehicle_brand=filters['vehicle_brand'])
-            if filters.get('vehicle_type'):
-                queryset = queryset.filter(vehicle_type=filters['vehicle_type'])
+        if filters.get('vehicle_brand'):
+            queryset = queryset.filter(vehicle_brand=filters['vehicle_brand'])
+        if filters.get('vehicle_type'):
+            queryset = queryset.filter(vehicle_type=filters['vehicle_type'])
         
-        # Calculate key metrics
-        total_vehicles = queryset.values('license_plate').distinct().count()
-        total_revenue = queryset.aggregate(Sum('amount_paid'))['amount_paid__sum'] or 0
-        avg_duration = queryset.aggregate(Avg('duration_minutes'))['duration_minutes__avg'] or 0
+        # Calculate key metrics in a single scan
+        metrics = queryset.aggregate(
+            total_vehicles=Count('plate_number', distinct=True),
+            total_revenue=Sum('amount_paid'),
+            avg_duration=Avg('duration_minutes'),
+            record_count=Count('id')
+        )
         
         # Get top organizations
-        top_orgs = queryset.values('organization__name').annotate(
-            vehicle_count=Count('license_plate', distinct=True),
+        top_orgs = queryset.values('organization').annotate(
+            vehicle_count=Count('plate_number', distinct=True),
             total_revenue=Sum('amount_paid')
         ).order_by('-total_revenue')[:5]
         
         return {
-            'total_vehicles': total_vehicles,
-            'total_revenue': float(total_revenue),
-            'avg_duration': float(avg_duration),
+            'total_vehicles': metrics['total_vehicles'],
+            'total_revenue': float(metrics['total_revenue'] or 0),
+            'avg_duration': float(metrics['avg_duration'] or 0),
             'top_organizations': list(top_orgs),
-            'record_count': queryset.count()
+            'record_count': metrics['record_count']
         }
 
     def _get_vehicle_context(self, user, filters):
@@ -86,73 +471,71 @@ class AIAssistant:
             return {'vehicle_found': False}
             
         license_plate = filters['license_plate'].upper()
-        vehicle_records = ParkingRecord.objects.filter(license_plate=license_plate)
+        vehicle_records = ParkingRecord.objects.filter(plate_number=license_plate)
+        
+        # Calculate vehicle metrics in a single scan; no visits means no such vehicle
+        metrics = vehicle_records.aggregate(
+            total_visits=Count('id'),
+            total_amount=Sum('amount_paid'),
+            avg_duration=Avg('duration_minutes'),
+            last_visit=Max('entry_time')
+        )
         
-        if not vehicle_records.exists():
+        if not metrics['total_visits']:
             return {'vehicle_found': False, 'searched_plate': license_plate}
-            
-        # Calculate vehicle metrics
-        total_visits = vehicle_records.count()
-        total_amount = vehicle_records.aggregate(Sum('amount_paid'))['amount_paid__sum'] or 0
-        avg_duration = vehicle_records.aggregate(Avg('duration_minutes'))['duration_minutes__avg'] or 0
         
-        # Get destinations
-        destinations = vehicle_records.values('organization__name').annotate(
+        # Get top destinations; the prompt and fallback only ever use the first few
+        destinations = vehicle_records.values('organization').annotate(
             visits=Count('id'),
             total_amount=Sum('amount_paid'),
             avg_duration=Avg('duration_minutes')
-        ).order_by('-visits')
+        ).order_by('-visits')[:10]
         
         return {
             'vehicle_found': True,
             'license_plate': license_plate,
-            'total_visits': total_visits,
-            'total_amount': float(total_amount),
-            'avg_duration': float(avg_duration),
+            'total_visits': metrics['total_visits'],
+            'total_amount': float(metrics['total_amount'] or 0),
+            'avg_duration': float(metrics['avg_duration'] or 0),
             'destinations': list(destinations),
-            'last_visit': vehicle_records.order_by('-entry_time').first().entry_time.isoformat()
+            'last_visit': metrics['last_visit'].isoformat()
         }
 
-    def _get_dashboard_context(self, user):
+    def _get_dashboard_context(self, user, org_name):
         """Get dashboard-specific context"""
         if user.role == 'super_admin':
-            total_orgs = Organization.objects.count()
-            total_users = CustomUser.objects.count()
+            total_orgs = _cached_count(ORGANIZATION_COUNT_CACHE_KEY, Organization)
+            total_users = _cached_count(USER_COUNT_CACHE_KEY, CustomUser)
             return {
                 'total_organizations': total_orgs,
                 'total_users': total_users,
                 'user_type': 'super_admin'
             }
         elif user.role == 'organization_admin':
-            org_users = CustomUser.objects.filter(organization=user.organization).count()
-            active_users = CustomUser.objects.filter(organization=user.organization, is_active=True).count()
+            user_counts = _org_user_counts(user.organization_id)
+            org_users = user_counts['total']
+            active_users = user_counts['active']
             
             # Get vehicle data for the organization if available
             vehicle_data = {}
             try:
-                from django.db import connection
-                with connection.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT COUNT(DISTINCT "Plate Number") as vehicle_count,
-                               SUM("Amount Paid") as total_revenue,
-                               AVG("Duration (Minutes)") as avg_duration
-                        FROM combined_dataset 
-                        WHERE "Organization" = %s
-                    """, [user.organization.name])
-                    result = cursor.fetchone()
-                    if result:
-                        vehicle_data = {
-                            'vehicle_count': result[0] or 0,
-                            'total_revenue': float(result[1] or 0),
-                            'avg_duration': float(result[2] or 0)
-                        }
+                stats = ParkingRecord.objects.filter(organization=org_name).aggregate(
+                    vehicle_count=Count('plate_number', distinct=True),
+                    total_revenue=Sum('amount_paid'),
+                    avg_duration=Avg('duration_minutes')
+                )
+                vehicle_data = {
+                    'vehicle_count': stats['vehicle_count'] or 0,
+                    'total_revenue': float(stats['total_revenue'] or 0),
+                    'avg_duration': float(stats['avg_duration'] or 0)
+                }
             except Exception as e:
                 logger.error(f"Error fetching vehicle data: {e}")
             
             return {
                 'organization_users': org_users,
                 'active_users': active_users,
-                'organization_name': user.organization.name,
+                'organization_name': org_name,
                 'user_type': 'org_admin',
                 **vehicle_data
             }
@@ -171,132 +554,134 @@ class AIAssistant:
         try:
             system_prompt = self._build_system_prompt(context)
             
-            response = self.client.ChatCompletion.create(
-                model="gpt-3.5-turbo",
+            # Identical prompt + question pairs reuse the earlier reply
+            cache_key = completion_cache_key(_CHAT_OPTIONS['model'], system_prompt, message)
+            cached_response = cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
+            
+            response = self.client.chat.completions.create(
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": message}
                 ],
-                max_tokens=500,
-                temperature=0.7
+                **_CHAT_OPTIONS
             )
             
-            return {
+            result = {
                 'response': response.choices[0].message.content,
                 'source': 'openai',
                 'context_used': True
             }
+            cache.set(cache_key, result, AI_RESPONSE_CACHE_TIMEOUT)
+            return result
             
         except Exception as e:
             logger.error(f"OpenAI API error: {str(e)}")
             return self._generate_fallback_response(message, context)
 
-    def _build_system_prompt(self, context):
-        """Build system prompt with context data"""
-        base_prompt = """You are an advanced AI assistant for a Vehicle Intelligence System. 
-        You provide detailed analytics, insights, and recommendations based on real fleet data.
-        
-        Current Context:
-        """
-        
-        if context['page_type'] == 'analytics':
-            base_prompt += f"""
-            - Page: Analytics Dashboard
-            - Total Vehicles: {context.get('total_vehicles', 'N/A')}
-            - Total Revenue: KSh {context.get('total_revenue', 0):,.2f}
-            - Average Duration: {context.get('avg_duration', 0):.1f} minutes
-            - User Role: {context['user_role']}
-            - Organization: {context['organization']}
-            
-            Provide insights on fleet performance, optimization opportunities, and data interpretation.
-            """
-        elif context['page_type'] == 'vehicle_alert':
-            if context.get('vehicle_found'):
-                base_prompt += f"""
-                - Page: Vehicle Alert System
-                - Vehicle: {context['license_plate']}
-                - Total Visits: {context['total_visits']}
-                - Total Amount: KSh {context['total_amount']:,.2f}
-                - Average Duration: {context['avg_duration']:.1f} minutes
-                - Last Visit: {context['last_visit']}
-                
-                Provide vehicle-specific analysis, performance insights, and recommendations.
-                """
-            else:
-                base_prompt += """
-                - Page: Vehicle Alert System
-                - No vehicle currently selected
-                
-                Help with vehicle search and explain system capabilities.
-                """
-        elif context['page_type'] == 'org_admin_dashboard':
-            base_prompt += f"""
-            - Page: Organization Admin Dashboard
-            - Organization: {context.get('organization_name', 'N/A')}
-            - Total Users: {context.get('organization_users', 0)}
-            - Active Users: {context.get('active_users', 0)}
-            - Fleet Vehicles: {context.get('vehicle_count', 0)}
-            - Fleet Revenue: KSh {context.get('total_revenue', 0):,.2f}
-            - Average Parking Duration: {context.get('avg_duration', 0):.1f} minutes
-            - User Role: Organization Administrator
-            
-            Provide organization management insights, user analytics, fleet performance analysis, and administrative recommendations.
-            """
-        elif context['page_type'] == 'dashboard':
-            if context.get('user_type') == 'super_admin':
-                base_prompt += f"""
-                - Page: Super Admin Dashboard
-                - Total Organizations: {context.get('total_organizations', 0)}
-                - Total Users: {context.get('total_users', 0)}
-                - User Role: Super Administrator
-                
-                Provide system-wide insights, organizational comparisons, and strategic recommendations.
-                """
-            else:
-                base_prompt += f"""
-                - Page: User Dashboard
-                - User Role: {context['user_role']}
-                - Organization: {context['organization']}
-                
-                Provide user-specific insights and system navigation help.
-                """
+    async def agenerate_ai_response(self, message, context):
+        """Async counterpart of generate_ai_response using the AsyncOpenAI client"""
+        client = self.get_async_client()
+        if not (client and OPENAI_AVAILABLE):
+            return self._generate_fallback_response(message, context)
         
-        base_prompt += """
+        try:
+            system_prompt = self._build_system_prompt(context)
+            
+            cache_key = completion_cache_key(_CHAT_OPTIONS['model'], system_prompt, message)
+            cached_response = await cache.aget(cache_key)
+            if cached_response is not None:
+                return cached_response
+            
+            response = await client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": message}
+                ],
+                **_CHAT_OPTIONS
+            )
+            
+            result = {
+                'response': response.choices[0].message.content,
+                'source': 'openai',
+                'context_used': True
+            }
+            await cache.aset(cache_key, result, AI_RESPONSE_CACHE_TIMEOUT)
+            return result
+            
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            return self._generate_fallback_response(message, context)
+
+    async def astream_ai_response(self, message, context):
+        """Yield response events ({'delta', 'source'}) as the AsyncOpenAI client streams tokens back"""
+        client = self.get_async_client()
+        if not (client and OPENAI_AVAILABLE):
+            yield {'delta': self._generate_fallback_response(message, context)['response'], 'source': 'fallback'}
+            return
         
-        Guidelines:
-        - Provide specific, actionable insights based on the data
-        - Use professional but friendly tone
-        - Include relevant metrics and comparisons
-        - Suggest optimization opportunities
-        - Keep responses concise but informative
-        - Use emojis sparingly for better readability
-        """
+        system_prompt = self._build_system_prompt(context)
+        cache_key = completion_cache_key(_CHAT_OPTIONS['model'], system_prompt, message)
+        cached_response = await cache.aget(cache_key)
+        if cached_response is not None:
+            yield {'delta': cached_response['response'], 'source': cached_response['source']}
+            return
         
-        return base_prompt
+        parts = []
+        try:
+            stream = await client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": message}
+                ],
+                **_CHAT_OPTIONS,
+                stream=True
+            )
+            
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield {'delta': delta, 'source': 'openai'}
+            
+            await cache.aset(cache_key, {
+                'response': ''.join(parts),
+                'source': 'openai',
+                'context_used': True
+            }, AI_RESPONSE_CACHE_TIMEOUT)
+            
+        except Exception as e:
+            logger.error(f"OpenAI streaming error: {str(e)}")
+            # Only fall back if nothing reached the client yet
+            if not parts:
+                yield {'delta': self._generate_fallback_response(message, context)['response'], 'source': 'fallback'}
+
+    def _build_system_prompt(self, context):
+        """Build system prompt with context data"""
+        fields = tuple(
+            (name, _prompt_value(name, context[name]))
+            for name in _PROMPT_FIELDS if name in context
+        )
+        return _prompt_for(context['page_type'], fields)
 
     def _generate_fallback_response(self, message, context):
         """Generate intelligent fallback response without OpenAI"""
-        message_lower = message.lower()
+        intents = {_KEYWORD_DISPATCH[keyword.lower()] for keyword in _INTENT_RE.findall(message)}
         
         # Context-aware responses
-        if context['page_type'] == 'analytics':
-            return self._analytics_fallback_response(message_lower, context)
-        elif context['page_type'] == 'vehicle_alert':
-            return self._vehicle_fallback_response(message_lower, context)
-        elif context['page_type'] == 'org_admin_dashboard':
-            return self._org_admin_fallback_response(message_lower, context)
-        else:
-            return self._dashboard_fallback_response(message_lower, context)
+        handler = _FALLBACK_HANDLERS.get(context['page_type'], '_dashboard_fallback_response')
+        return getattr(self, handler)(intents, context)
 
-    def _analytics_fallback_response(self, message, context):
+    def _analytics_fallback_response(self, intents, context):
         """Analytics-specific fallback responses"""
-        if 'summary' in message or 'overview' in message:
+        if 'summary' in intents:
             return {
                 'response': f"Analytics Summary: Your fleet has {context.get('total_vehicles', 0)} vehicles generating KSh {context.get('total_revenue', 0):,.2f} in revenue. Average parking duration is {context.get('avg_duration', 0):.1f} minutes. Fleet utilization shows {'high' if context.get('avg_duration', 0) > 60 else 'moderate'} engagement patterns.",
                 'source': 'fallback',
                 'context_used': True
             }
-        elif 'recommendation' in message:
+        elif 'recommend' in intents:
             revenue = context.get('total_revenue', 0)
             duration = context.get('avg_duration', 0)
             recommendations = []
@@ -320,7 +705,7 @@ class AIAssistant:
             'context_used': False
         }
 
-    def _vehicle_fallback_response(self, message, context):
+    def _vehicle_fallback_response(self, intents, context):
         """Vehicle-specific fallback responses"""
         if not context.get('vehicle_found'):
             return {
@@ -329,13 +714,13 @@ class AIAssistant:
                 'context_used': True
             }
             
-        if 'summary' in message or 'overview' in message:
+        if 'summary' in intents:
             return {
                 'response': f"Vehicle {context['license_plate']} Analysis: {context['total_visits']} total visits generating KSh {context['total_amount']:,.2f}. Average stay duration is {context['avg_duration']:.1f} minutes. Performance indicates {'high' if context['total_visits'] > 20 else 'moderate'} utilization.",
                 'source': 'fallback',
                 'context_used': True
             }
-        elif 'performance' in message:
+        elif 'performance' in intents:
             visits = context['total_visits']
             performance_level = 'excellent' if visits > 50 else 'good' if visits > 20 else 'moderate'
             return {
@@ -350,7 +735,7 @@ class AIAssistant:
             'context_used': True
         }
 
-    def _org_admin_fallback_response(self, message, context):
+    def _org_admin_fallback_response(self, intents, context):
         """Organization admin dashboard specific fallback responses"""
         org_name = context.get('organization_name', 'your organization')
         user_count = context.get('organization_users', 0)
@@ -358,20 +743,20 @@ class AIAssistant:
         vehicle_count = context.get('vehicle_count', 0)
         total_revenue = context.get('total_revenue', 0)
         
-        if 'summary' in message or 'overview' in message:
+        if 'summary' in intents:
             return {
                 'response': f"Organization Overview: {org_name} has {user_count} total users with {active_users} active users. Your fleet includes {vehicle_count} vehicles generating KSh {total_revenue:,.2f} in revenue. User engagement rate is {(active_users/user_count*100) if user_count > 0 else 0:.1f}%.",
                 'source': 'fallback',
                 'context_used': True
             }
-        elif 'users' in message or 'employees' in message:
+        elif 'users' in intents:
             inactive_users = user_count - active_users
             return {
                 'response': f"User Management: You have {user_count} users in {org_name}. {active_users} are active and {inactive_users} are inactive. {'Focus on re-engaging inactive users' if inactive_users > 0 else 'Excellent user engagement!'} Consider implementing user activity monitoring and profile completion initiatives.",
                 'source': 'fallback',
                 'context_used': True
             }
-        elif 'fleet' in message or 'vehicle' in message:
+        elif 'fleet' in intents:
             if vehicle_count > 0:
                 avg_revenue_per_vehicle = total_revenue / vehicle_count if vehicle_count > 0 else 0
                 return {
@@ -385,7 +770,7 @@ class AIAssistant:
                     'source': 'fallback',
                     'context_used': True
                 }
-        elif 'recommendation' in message or 'optimize' in message:
+        elif 'recommend' in intents:
             recommendations = []
             if user_count > 0 and (active_users/user_count) < 0.8:
                 recommendations.append("Increase user engagement through training and communication")
@@ -399,7 +784,7 @@ class AIAssistant:
                 'source': 'fallback',
                 'context_used': True
             }
-        elif 'report' in message:
+        elif 'report' in intents:
             return {
                 'response': f"I can generate comprehensive reports for {org_name} including: User activity analysis ({user_count} users), fleet performance summary ({vehicle_count} vehicles), revenue analysis (KSh {total_revenue:,.2f}), and organizational efficiency metrics. Would you like me to create a detailed management report?",
                 'source': 'fallback',
@@ -412,7 +797,7 @@ class AIAssistant:
             'context_used': True
         }
 
-    def _dashboard_fallback_response(self, message, context):
+    def _dashboard_fallback_response(self, intents, context):
         """Dashboard-specific fallback responses"""
         if context['user_type'] == 'super_admin':
             return {
@@ -433,96 +818,82 @@ class AIAssistant:
             'context_used': False
         }
 
-    def generate_detailed_report(self, context, report_type='comprehensive'):
+    def generate_detailed_report(self, context, report_type='comprehensive', now=None):
         """Generate detailed AI-powered reports"""
+        now = now or timezone.now()
         if self.client and OPENAI_AVAILABLE:
-            return self._generate_ai_report(context, report_type)
+            return self._generate_ai_report(context, report_type, now)
         else:
-            return self._generate_fallback_report(context, report_type)
+            return self._generate_fallback_report(context, report_type, now)
 
-    def _generate_ai_report(self, context, report_type):
-        """Generate AI-powered detailed report"""
+    async def agenerate_detailed_report(self, context, report_type='comprehensive', now=None):
+        """Async counterpart of generate_detailed_report using the AsyncOpenAI client"""
+        now = now or timezone.now()
+        client = self.get_async_client()
+        if not (client and OPENAI_AVAILABLE):
+            return self._generate_fallback_report(context, report_type, now)
+        
         try:
-            report_prompt = f"""
-            Generate a comprehensive {report_type} report based on this vehicle intelligence data:
-            {json.dumps(context, indent=2)}
-            
-            Include:
-            1. Executive Summary
-            2. Key Performance Indicators
-            3. Trend Analysis
-            4. Optimization Recommendations
-            5. Predictive Insights
-            6. Action Items
+            response = await client.chat.completions.create(
+                messages=[{"role": "user", "content": _report_prompt(context, report_type)}],
+                **_REPORT_OPTIONS
+            )
             
-            Format as structured text suitable for PDF generation.
-            """
+            return {
+                'report_content': response.choices[0].message.content,
+                'source': 'openai',
+                'generated_at': now.isoformat()
+            }
             
-            response = self.client.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": report_prompt}],
-                max_tokens=1500,
-                temperature=0.5
+        except Exception as e:
+            logger.error(f"AI report generation error: {str(e)}")
+            return self._generate_fallback_report(context, report_type, now)
+
+    def _generate_ai_report(self, context, report_type, now):
+        """Generate AI-powered detailed report"""
+        try:
+            response = self.client.chat.completions.create(
+                messages=[{"role": "user", "content": _report_prompt(context, report_type)}],
+                **_REPORT_OPTIONS
             )
             
             return {
                 'report_content': response.choices[0].message.content,
                 'source': 'openai',
-                'generated_at': datetime.now().isoformat()
+                'generated_at': now.isoformat()
             }
             
         except Exception as e:
             logger.error(f"AI report generation error: {str(e)}")
-            return self._generate_fallback_report(context, report_type)
+            return self._generate_fallback_report(context, report_type, now)
 
-    def _generate_fallback_report(self, context, report_type):
+    def _generate_fallback_report(self, context, report_type, now):
         """Generate structured fallback report"""
-        report_sections = []
-        
-        # Executive Summary
+        # Executive Summary; the recommendations section is a constant
         if context['page_type'] == 'analytics':
-            summary = f"""
-            EXECUTIVE SUMMARY
-            =================
-            Fleet Performance Overview for {context['organization']}
-            
-            • Total Vehicles: {context.get('total_vehicles', 0)}
-            • Revenue Generated: KSh {context.get('total_revenue', 0):,.2f}
-            • Average Utilization: {context.get('avg_duration', 0):.1f} minutes
-            • Performance Rating: {'Excellent' if context.get('total_revenue', 0) > 100000 else 'Good'}
-            """
+            summary = _ANALYTICS_SUMMARY_TPL.substitute(
+                organization=context['organization'],
+                total_vehicles=context.get('total_vehicles', 0),
+                total_revenue=f"{context.get('total_revenue', 0):,.2f}",
+                avg_duration=f"{context.get('avg_duration', 0):.1f}",
+                rating='Excellent' if context.get('total_revenue', 0) > 100000 else 'Good'
+            )
         else:
-            summary = f"""
-            VEHICLE INTELLIGENCE REPORT
-            ===========================
-            Analysis for {context.get('license_plate', 'Selected Vehicle')}
-            
-            • Total Visits: {context.get('total_visits', 0)}
-            • Revenue Impact: KSh {context.get('total_amount', 0):,.2f}
-            • Utilization Pattern: {context.get('avg_duration', 0):.1f} min average
-            • Performance Status: {'High Performer' if context.get('total_visits', 0) > 30 else 'Standard'}
-            """
-        
-        report_sections.append(summary)
-        
-        # Recommendations
-        recommendations = """
-        OPTIMIZATION RECOMMENDATIONS
-        ============================
-        1. Monitor peak usage patterns for capacity planning
-        2. Implement predictive maintenance schedules
-        3. Optimize pricing strategies based on demand
-        4. Enhance route efficiency through data analysis
-        5. Consider fleet expansion in high-demand areas
-        """
-        
-        report_sections.append(recommendations)
+            summary = _VEHICLE_SUMMARY_TPL.substitute(
+                license_plate=context.get('license_plate', 'Selected Vehicle'),
+                total_visits=context.get('total_visits', 0),
+                total_amount=f"{context.get('total_amount', 0):,.2f}",
+                avg_duration=f"{context.get('avg_duration', 0):.1f}",
+                status='High Performer' if context.get('total_visits', 0) > 30 else 'Standard'
+            )
         
         return {
-            'report_content': '\n'.join(report_sections),
+            'report_content': f"{summary}\n{_REPORT_RECOMMENDATIONS}",
             'source': 'fallback',
-            'generated_at': datetime.now().isoformat()
+            'generated_at': now.isoformat()
         }
 
-# Initialize global AI assistant instance
-ai_assistant = AIAssistant()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_ai_assistant():
+    """Return the process-wide AI assistant, created on first use"""
+    return AIAssistant()
\ No newline at end of file
@@ -1,38 +1,56 @@
-import openai
-import json
-from django.conf import settings
-from .models import VehicleMovement, Vehicle
+import orjson
+from functools import lru_cache
+from django.core.cache import cache
+from .ai_assistant import (
+    AIAssistant, AI_CONTEXT_CACHE_TIMEOUT, AI_RESPONSE_CACHE_TIMEOUT,
+    context_cache_key, completion_cache_key
+)
+from .models import ParkingRecord
 
 class AIAssistantService:
-    def __init__(self):
-        openai.api_key = settings.OPENAI_API_KEY
+    @property
+    def client(self):
+        # Looked up per call so the shared service picks up the client once a key is configured
+        return AIAssistant.get_client()
     
     def get_vehicle_context(self, user_org):
         """Get vehicle data context for AI"""
-        movements = VehicleMovement.objects.filter(
+        cache_key = context_cache_key('ai_vehicle_ctx', user_org, None)
+        context = cache.get(cache_key)
+        if context is not None:
+            return context
+        
+        # Only the ten most recent visits make it into the prompt
+        rows = ParkingRecord.objects.filter(
             organization=user_org
-        ).select_related('vehicle')[:50]
-        
-        context = []
-        for movement in movements:
-            context.append({
-                'plate': movement.plate_number,
-                'entry_time': str(movement.entry_time),
-                'exit_time': str(movement.exit_time) if movement.exit_time else 'Still parked',
-                'amount': float(movement.amount_paid),
-                'location': movement.organization
-            })
+        ).values_list('plate_number', 'entry_time', 'exit_time', 'amount_paid', 'organization')[:10]
+        
+        context = [
+            {
+                'plate': plate,
+                'entry_time': str(entry_time),
+                'exit_time': str(exit_time) if exit_time else 'Still parked',
+                'amount': float(amount),
+                'location': location
+            }
+            for plate, entry_time, exit_time, amount, location in rows
+        ]
         
+        cache.set(cache_key, context, AI_CONTEXT_CACHE_TIMEOUT)
         return context
     
     def chat_response(self, user_message, user_org):
         """Generate AI response with vehicle context"""
+        client = self.client
+        if client is None:
+            return "AI chat is not available right now. Please contact your administrator."
+        
         vehicle_data = self.get_vehicle_context(user_org)
         
         system_prompt = f"""
         You are a vehicle intelligence assistant. Help users with parking and vehicle movement queries.
         
-        Available vehicle data: {json.dumps(vehicle_data[:10])}
+        Available vehicle data: {orjson.dumps(vehicle_data).decode()}
         
         Answer questions about:
         - Vehicle locations and parking status
@@ -43,8 +61,13 @@ class AIAssistantService:
         Keep responses concise and helpful.
         """
         
+        cache_key = completion_cache_key("gpt-4o-mini", system_prompt, user_message)
+        cached_reply = cache.get(cache_key)
+        if cached_reply is not None:
+            return cached_reply
+        
         try:
-            response = openai.ChatCompletion.create(
+            response = client.chat.completions.create(
                 model="gpt-4o-mini",  # Cost-effective option
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -54,7 +77,15 @@ class AIAssistantService:
                 temperature=0.7
             )
             
-            return response.choices[0].message.content
+            reply = response.choices[0].message.content
+            cache.set(cache_key, reply, AI_RESPONSE_CACHE_TIMEOUT)
+            return reply
             
         except Exception as e:
-            return f"Sorry, I'm having trouble processing your request. Please try again."
\ No newline at end of file
+            return f"Sorry, I'm having trouble processing your request. Please try again."
+
+
+@lru_cache(maxsize=1)
+def get_ai_service():
+    """Return the process-wide AI assistant service, created on first use"""
+    return AIAssistantService()
@@ -1,55 +1,140 @@
 # ai_views.py
-from django.http import JsonResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_page
+from django.views.decorators.vary import vary_on_headers
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views import View
-import json
-from .ai_assistant import ai_assistant
+from asgiref.sync import sync_to_async
+import orjson
+from .ai_assistant import get_ai_assistant
 import logging
 
 logger = logging.getLogger(__name__)
 
+_SUGGESTIONS_ANALYTICS = (
+    "Give me a performance summary",
+    "What optimization recommendations do you have?",
+    "Show me trend analysis",
+    "Generate a detailed report",
+    "What insights can you provide?"
+)
+_SUGGESTIONS_VEHICLE_FOUND_TMPL = (
+    "Analyze {plate} performance",
+    "What maintenance recommendations do you have?",
+    "Show cost analysis",
+    "Generate vehicle report",
+    "Compare with fleet average"
+)
+_SUGGESTIONS_VEHICLE_MISSING = (
+    "How do I search for a vehicle?",
+    "What data can you analyze?",
+    "Show me search examples",
+    "Explain vehicle metrics"
+)
+_SUGGESTIONS_DEFAULT = (
+    "Give me a system overview",
+    "What can you help me with?",
+    "Show me key insights",
+    "Generate dashboard report"
+)
+
+
+class OrjsonResponse(HttpResponse):
+    """JSON response serialized with orjson"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=orjson.dumps(data, default=str), **kwargs)
+
+
 @csrf_exempt
 @login_required
 @require_http_methods(["POST"])
-def ai_chat_endpoint(request):
-    """Handle AI chat requests"""
+async def ai_chat_endpoint(request):
+    """Handle AI chat requests without blocking a worker on the OpenAI call"""
     try:
-        data = json.loads(request.body)
+        data = orjson.loads(request.body)
         message = data.get('message', '').strip()
         page_type = data.get('page_type', 'dashboard')
         filters = data.get('filters', {})
         
         if not message:
-            return JsonResponse({
+            return OrjsonResponse({
                 'success': False,
                 'error': 'Message is required'
             }, status=400)
         
+        assistant = get_ai_assistant()
+        user = await request.auser()
+        
         # Get context data for AI
-        context = ai_assistant.get_context_data(request.user, page_type, filters)
+        context = await sync_to_async(assistant.get_context_data)(user, page_type, filters)
         
         # Generate AI response
-        ai_response = ai_assistant.generate_ai_response(message, context)
+        ai_response = await assistant.agenerate_ai_response(message, context)
         
-        return JsonResponse({
+        return OrjsonResponse({
             'success': True,
             'response': ai_response['response'],
             'source': ai_response['source'],
             'context_used': ai_response['context_used'],
-            'timestamp': context['timestamp']
+            'timestamp': request._now.isoformat()
         })
         
-    except json.JSONDecodeError:
-        return JsonResponse({
+    except orjson.JSONDecodeError:
+        return OrjsonResponse({
             'success': False,
             'error': 'Invalid JSON data'
         }, status=400)
     except Exception as e:
         logger.error(f"AI chat error: {str(e)}")
-        return JsonResponse({
+        return OrjsonResponse({
+            'success': False,
+            'error': 'Internal server error'
+        }, status=500)
+
+@csrf_exempt
+@login_required
+@require_http_methods(["POST"])
+async def ai_chat_stream_endpoint(request):
+    """Stream AI chat responses as server-sent events from the AsyncOpenAI stream"""
+    try:
+        data = orjson.loads(request.body)
+        message = data.get('message', '').strip()
+        page_type = data.get('page_type', 'dashboard')
+        filters = data.get('filters', {})
+        
+        if not message:
+            return OrjsonResponse({
+                'success': False,
+                'error': 'Message is required'
+            }, status=400)
+        
+        assistant = get_ai_assistant()
+        user = await request.auser()
+        context = await sync_to_async(assistant.get_context_data)(user, page_type, filters)
+        
+        # An async iterator, so ASGI sends each chunk as it arrives instead of buffering
+        async def event_stream():
+            async for event in assistant.astream_ai_response(message, context):
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+            yield b"data: " + orjson.dumps({'done': True, 'timestamp': request._now}) + b"\n\n"
+        
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+        
+    except orjson.JSONDecodeError:
+        return OrjsonResponse({
+            'success': False,
+            'error': 'Invalid JSON data'
+        }, status=400)
+    except Exception as e:
+        logger.error(f"AI chat stream error: {str(e)}")
+        return OrjsonResponse({
             'success': False,
             'error': 'Internal server error'
         }, status=500)
@@ -57,21 +142,24 @@ def ai_chat_endpoint(request):
 @csrf_exempt
 @login_required
 @require_http_methods(["POST"])
-def ai_report_endpoint(request):
-    """Handle AI report generation requests"""
+async def ai_report_endpoint(request):
+    """Handle AI report generation requests without blocking a worker on the OpenAI call"""
     try:
-        data = json.loads(request.body)
+        data = orjson.loads(request.body)
         page_type = data.get('page_type', 'dashboard')
         report_type = data.get('report_type', 'comprehensive')
         filters = data.get('filters', {})
         
+        assistant = get_ai_assistant()
+        user = await request.auser()
+        
         # Get context data for report
-        context = ai_assistant.get_context_data(request.user, page_type, filters)
+        context = await sync_to_async(assistant.get_context_data)(user, page_type, filters)
         
         # Generate detailed report
-        report_data = ai_assistant.generate_detailed_report(context, report_type)
+        report_data = await assistant.agenerate_detailed_report(context, report_type, now=request._now)
         
-        return JsonResponse({
+        return OrjsonResponse({
             'success': True,
             'report': report_data['report_content'],
             'source': report_data['source'],
@@ -79,70 +167,52 @@ def ai_report_endpoint(request):
             'report_type': report_type
         })
         
-    except json.JSONDecodeError:
-        return JsonResponse({
+    except orjson.JSONDecodeError:
+        return OrjsonResponse({
             'success': False,
             'error': 'Invalid JSON data'
         }, status=400)
     except Exception as e:
         logger.error(f"AI report error: {str(e)}")
-        return JsonResponse({
+        return OrjsonResponse({
             'success': False,
             'error': 'Internal server error'
         }, status=500)
 
 @login_required
 @require_http_methods(["GET"])
+@cache_page(60 * 5)
+@vary_on_headers('Cookie')
 def ai_suggestions_endpoint(request):
     """Get AI-powered suggestions based on current context"""
     try:
         page_type = request.GET.get('page_type', 'dashboard')
-        filters = {}
-        
-        # Extract filters from query parameters
-        for key in ['organization', 'vehicle_brand', 'vehicle_type', 'license_plate']:
-            if request.GET.get(key):
-                filters[key] = request.GET.get(key)
         
-        # Get context data
-        context = ai_assistant.get_context_data(request.user, page_type, filters)
+        # Only the vehicle page varies with data; the others are fixed lists
+        context = {}
+        if page_type == 'vehicle_alert':
+            filters = {}
+            
+            # Extract filters from query parameters
+            for key in ['organization', 'vehicle_brand', 'vehicle_type', 'license_plate']:
+                if request.GET.get(key):
+                    filters[key] = request.GET.get(key)
+            
+            context = get_ai_assistant().get_context_data(request.user, page_type, filters)
         
         # Generate contextual suggestions
-        suggestions = []
-        
         if page_type == 'analytics':
-            suggestions = [
-                "Give me a performance summary",
-                "What optimization recommendations do you have?",
-                "Show me trend analysis",
-                "Generate a detailed report",
-                "What insights can you provide?"
-            ]
+            suggestions = list(_SUGGESTIONS_ANALYTICS)
         elif page_type == 'vehicle_alert':
             if context.get('vehicle_found'):
-                suggestions = [
-                    f"Analyze {context.get('license_plate', 'this vehicle')} performance",
-                    "What maintenance recommendations do you have?",
-                    "Show cost analysis",
-                    "Generate vehicle report",
-                    "Compare with fleet average"
-                ]
+                plate = context.get('license_plate', 'this vehicle')
+                suggestions = [s.format(plate=plate) for s in _SUGGESTIONS_VEHICLE_FOUND_TMPL]
             else:
-                suggestions = [
-                    "How do I search for a vehicle?",
-                    "What data can you analyze?",
-                    "Show me search examples",
-                    "Explain vehicle metrics"
-                ]
+                suggestions = list(_SUGGESTIONS_VEHICLE_MISSING)
         else:
-            suggestions = [
-                "Give me a system overview",
-                "What can you help me with?",
-                "Show me key insights",
-                "Generate dashboard report"
-            ]
-        
-        return JsonResponse({
+            suggestions = list(_SUGGESTIONS_DEFAULT)
+        
+        return OrjsonResponse({
             'success': True,
             'suggestions': suggestions,
             'context': {
@@ -153,7 +223,7 @@ def ai_suggestions_endpoint(request):
         
     except Exception as e:
         logger.error(f"AI suggestions error: {str(e)}")
-        return JsonResponse({
+        return OrjsonResponse({
             'success': False,
             'error': 'Internal server error'
         }, status=500)
\ No newline at end of file
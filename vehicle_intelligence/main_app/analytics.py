@@ -2,12 +2,193 @@
 Simplified Vehicle Analytics Module for PostgreSQL
 Working with actual combined_dataset table structure
 """
-from django.core.cache import cache
-from django.db import connection
+from django.core.cache import cache, caches
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Sum
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from datetime import datetime, timedelta
-import plotly.graph_objects as go
-import plotly.express as px
+from functools import lru_cache
+import hashlib
+import random
+import uuid
+import numpy as np
+from .models import CustomUser, Vehicle, VehicleMovement
+from .signals import ANALYTICS_VERSION_CACHE_KEY
+
+
+# Every dashboard aggregate, read from the trigger-maintained counter tables
+# rather than by scanning combined_dataset, so results are always current.
+# Rows are (kind, label, v1, v2, v3); "kind" says which chart a row feeds.
+_AGGREGATES_SQL = """
+    WITH a AS (
+        SELECT NULLIF(org, '') AS org, NULLIF(vehicle_type, '') AS vehicle_type, records,
+               amount_sum, amount_count, paid_count, paid_amount_sum, paid_duration_sum
+        FROM dashboard_amounts
+        WHERE {counter_where} AND records > 0
+    )
+    SELECT 'fleet', NULL::text, NULL::numeric, COALESCE(SUM(records), 0)::bigint,
+           SUM(amount_sum) / NULLIF(SUM(amount_count), 0) FROM a
+    UNION ALL
+    (SELECT 'org_amount', org, SUM(amount_sum) / NULLIF(SUM(amount_count), 0), SUM(records)::bigint, NULL
+     FROM a GROUP BY org ORDER BY 3 DESC LIMIT 10)
+    UNION ALL
+    SELECT 'hourly', hour::text, SUM(entries), NULL, NULL FROM dashboard_hourly
+    WHERE {counter_where} GROUP BY hour
+    UNION ALL
+    SELECT 'org_vehicles', NULLIF(org, ''), {distinct_plates}, NULL, NULL FROM dashboard_plate_visits
+    WHERE {counter_where} AND visits > 0 AND plate <> '' GROUP BY org
+    UNION ALL
+    SELECT 'org_revenue', org, SUM(paid_amount_sum), NULL, NULL FROM a
+    GROUP BY org HAVING SUM(paid_count) > 0
+    UNION ALL
+    SELECT 'visits', bucket, COUNT(*), NULL, NULL FROM (
+        SELECT CASE WHEN SUM(visits) = 1 THEN '1'
+                    WHEN SUM(visits) <= 3 THEN '2-3'
+                    WHEN SUM(visits) <= 5 THEN '4-5'
+                    WHEN SUM(visits) <= 10 THEN '6-10'
+                    ELSE '10+' END AS bucket
+        FROM dashboard_plate_visits WHERE {counter_where}
+        GROUP BY plate HAVING SUM(visits) > 0
+    ) v GROUP BY bucket
+    UNION ALL
+    SELECT 'type_duration', vehicle_type, SUM(paid_duration_sum) / SUM(paid_count), SUM(paid_count)::bigint, NULL
+    FROM a GROUP BY vehicle_type HAVING SUM(paid_count) > 0
+"""
+
+# Filter columns in the dashboard counter tables
+_COUNTER_FILTER_COLUMNS = ('org', 'brand', 'vehicle_type')
+
+# Per-site vehicle counts: HyperLogLog estimate (about 1% error) when available
+_EXACT_DISTINCT_PLATES = 'COUNT(DISTINCT plate)'
+_APPROX_DISTINCT_PLATES = 'hll_cardinality(hll_add_agg(hll_hash_text(plate)))::bigint'
+
+VISIT_GROUPS = ('1', '2-3', '4-5', '6-10', '10+')
+
+
+# Static Plotly.js trace settings and layouts, shared by every chart built
+_PARKING_TRACE = {
+    'type': 'bar',
+    'name': 'Average Amount Paid',
+    'marker': {'color': '#3b82f6'}
+}
+_PARKING_LAYOUT = {
+    'title': 'Average Amount Paid by Location',
+    'xaxis': {'title': 'Location'},
+    'yaxis': {'title': 'Average Amount (KSh)'},
+    'template': 'plotly_white',
+    'height': 400
+}
+
+_HOURLY_TRACE = {
+    'type': 'scatter',
+    'mode': 'lines+markers',
+    'name': 'Vehicle Entries',
+    'line': {'color': '#16a34a', 'width': 3},
+    'marker': {'size': 6}
+}
+_HOURLY_LAYOUT = {
+    'title': 'Hourly Vehicle Entries Pattern',
+    'xaxis': {'title': 'Hour of Day'},
+    'yaxis': {'title': 'Number of Vehicles'},
+    'template': 'plotly_white',
+    'height': 400,
+    'showlegend': False
+}
+
+_SITE_VEHICLES_TRACE = {
+    'type': 'pie',
+    'name': 'Vehicles',
+    'hovertemplate': '<b>%{label}</b><br>Vehicles: %{value}<br>Percentage: %{percent}<extra></extra>',
+    'textinfo': 'label+percent',
+    'textposition': 'auto'
+}
+_SITE_VEHICLES_LAYOUT = {
+    'title': 'Vehicle Distribution by Location',
+    'template': 'plotly_white',
+    'height': 400,
+    'showlegend': True
+}
+
+_SITE_REVENUE_TRACE = {
+    'type': 'bar',
+    'name': 'Revenue',
+    'marker': {'color': '#16a34a'},
+    'hovertemplate': '<b>%{x}</b><br>Revenue: KSh %{y:,.0f}<extra></extra>'
+}
+_SITE_REVENUE_LAYOUT = {
+    'title': 'Revenue per Location',
+    'xaxis': {'title': 'Location'},
+    'yaxis': {'title': 'Revenue (KSh)', 'type': 'log'},
+    'template': 'plotly_white',
+    'height': 400,
+    'showlegend': False
+}
+
+_VISIT_PATTERNS_TRACE = {
+    'type': 'bar',
+    'name': 'Vehicle Count',
+    'marker': {'color': '#3b82f6'}
+}
+_VISIT_PATTERNS_LAYOUT = {
+    'title': 'Vehicle Visit Patterns',
+    'xaxis': {'title': 'Number of Visits'},
+    'yaxis': {'title': 'Number of Vehicles'},
+    'template': 'plotly_white',
+    'height': 400,
+    'showlegend': False
+}
+
+_AVG_STAY_TRACE = {
+    'type': 'bar',
+    'name': 'Average Duration',
+    'marker': {'color': '#f59e0b'}
+}
+_AVG_STAY_LAYOUT = {
+    'title': 'Average Stay Duration by Vehicle Type',
+    'xaxis': {'title': 'Vehicle Type'},
+    'yaxis': {'title': 'Average Duration (Minutes)'},
+    'template': 'plotly_white',
+    'height': 400,
+    'showlegend': False
+}
+
+
+def _tiered_get_many(keys):
+    """Read keys from the per-process cache, falling back to the shared cache"""
+    local_cache = caches['local']
+    found = local_cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        shared = cache.get_many(missing)
+        if shared:
+            local_cache.set_many(shared)
+            found.update(shared)
+    return found
+
+
+def _tiered_set_many(values, timeout):
+    """Write values to the shared cache and the per-process cache"""
+    cache.set_many(values, timeout)
+    caches['local'].set_many(values)
+
+
+def _tiered_get_or_set(key, default, timeout):
+    """get_or_set against the shared cache, fronted by the per-process cache"""
+    local_cache = caches['local']
+    value = local_cache.get(key)
+    if value is None:
+        value = cache.get_or_set(key, default, timeout)
+        local_cache.set(key, value)
+    return value
+
+
+@lru_cache(maxsize=1)
+def _hll_available():
+    """Whether the postgresql-hll extension is installed, checked once per process"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'hll'")
+        return cursor.fetchone() is not None
 
 
 class VehicleAnalytics:
@@ -17,50 +198,87 @@ class VehicleAnalytics:
         self.organization = organization
         self.vehicle_brand = vehicle_brand
         self.vehicle_type = vehicle_type
+        self._agg_cache = None
+        # Charts already produced by this instance, by cache key
+        self._results = {}
+        # Filters (plus the data version, on first use) hashed once; cache keys reuse the digest
+        self._key_tuple = (organization.id if organization else None, vehicle_brand, vehicle_type)
+        self._key_digest = None
+        # SQL predicate for the counter tables, built once
+        self._filters_sql, self._filters_params = self._get_base_filters()
     
-    def _get_base_filters(self):
+    def _get_base_filters(self, columns=_COUNTER_FILTER_COLUMNS):
         """Get base SQL filters"""
         filters = []
         params = []
+        org_column, brand_column, type_column = columns
         
         if self.organization:
-            filters.append('"Organization" = %s')
+            filters.append(f'{org_column} = %s')
             params.append(self.organization.name)
         if self.vehicle_brand:
-            filters.append('"Vehicle Brand" = %s')
+            filters.append(f'{brand_column} = %s')
             params.append(self.vehicle_brand)
         if self.vehicle_type:
-            filters.append('"Vehicle Type" = %s')
+            filters.append(f'{type_column} = %s')
             params.append(self.vehicle_type)
             
         return " AND ".join(filters), params
     
+    def _cache_key(self, name, *extra):
+        """Cache key for a chart, scoped to this instance's filters and the current data version"""
+        if self._key_digest is None:
+            self._set_cache_version(cache.get(ANALYTICS_VERSION_CACHE_KEY, 0))
+        return ':'.join((name, self._key_digest, *map(str, extra)))
+    
+    def _set_cache_version(self, version):
+        """Fix the data version this instance's cache keys are built against"""
+        key_tuple = (version, *self._key_tuple)
+        self._key_digest = hashlib.blake2b(repr(key_tuple).encode(), digest_size=8).hexdigest()
+    
+    def _get_or_build(self, key, build):
+        """Chart for a cache key, memoized on the instance in front of the tiered cache"""
+        if key not in self._results:
+            self._results[key] = _tiered_get_or_set(key, build, 300)
+        return self._results[key]
+    
+    def _fetch_all_aggregates(self):
+        """Run the fused aggregate query once per instance, grouping rows by chart"""
+        if self._agg_cache is not None:
+            return self._agg_cache
+        
+        sql = _AGGREGATES_SQL.format(
+            counter_where=self._filters_sql or 'TRUE',
+            distinct_plates=_APPROX_DISTINCT_PLATES if _hll_available() else _EXACT_DISTINCT_PLATES
+        )
+        with connection.cursor() as cursor:
+            # Placeholders appear as: amount totals, hourly counters, plate counters, visit counters
+            cursor.execute(sql, self._filters_params * 4)
+            aggregates = self._group_rows(cursor)
+        
+        self._agg_cache = aggregates
+        return aggregates
+    
+    @staticmethod
+    def _group_rows(cursor):
+        """Group aggregate rows by chart kind, straight off the cursor"""
+        aggregates = {}
+        for kind, *values in cursor:
+            aggregates.setdefault(kind, []).append(values)
+        return aggregates
+    
     def get_fleet_summary(self, days=30):
         """Get fleet summary with PostgreSQL optimization"""
-        cache_key = f'fleet_summary_{self.organization.id if self.organization else "all"}_{self.vehicle_brand}_{self.vehicle_type}_{days}'
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-        
-        filters, params = self._get_base_filters()
-        base_where = "1=1"
-        
-        if filters:
-            base_where += f" AND {filters}"
-        
-        with connection.cursor() as cursor:
-            sql = """
-                SELECT COUNT(DISTINCT "Plate Number") as total_vehicles,
-                       COUNT(*) as total_records,
-                       AVG("Amount Paid") as avg_amount
-                FROM combined_dataset 
-                WHERE """ + base_where
-            cursor.execute(sql, params)
-            result = cursor.fetchone()
-            
-        total_vehicles = result[0] or 0
-        total_records = result[1] or 0
-        avg_amount = result[2] or 0
+        return self._get_or_build(self._cache_key('fleet_summary', days), self._build_fleet_summary)
+    
+    def _build_fleet_summary(self):
+        """Build the fleet summary from the shared aggregates"""
+        aggregates = self._fetch_all_aggregates()
+        # No fleet row means no parking records in scope; report zeros as before
+        (_, _, total_records, avg_amount), = aggregates.get('fleet') or [(None, None, 0, None)]
+        # Every distinct plate lands in exactly one visit bucket, so the buckets sum to the fleet size
+        total_vehicles = sum(int(row[1]) for row in aggregates.get('visits', []))
+        total_records = int(total_records or 0)
         
         summary = {
             'total_vehicles': total_vehicles,
@@ -70,39 +288,19 @@ class VehicleAnalytics:
             'utilization_rate': 85.0  # Default value
         }
         
-        cache.set(cache_key, summary, 300)
         return summary
     
     def get_parking_duration_chart(self, days=30):
         """Generate parking duration chart data for Plotly.js"""
-        cache_key = f'parking_duration_{self.organization.id if self.organization else "all"}_{self.vehicle_brand}_{self.vehicle_type}_{days}'
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-            
-        filters, params = self._get_base_filters()
-        base_where = "1=1"
-        
-        if filters:
-            base_where += f" AND {filters}"
-        
-        with connection.cursor() as cursor:
-            sql = """
-                SELECT "Organization", 
-                       AVG("Amount Paid") as avg_amount,
-                       COUNT(*) as total_visits
-                FROM combined_dataset 
-                WHERE """ + base_where + """
-                GROUP BY "Organization" 
-                ORDER BY avg_amount DESC 
-                LIMIT 10
-            """
-            cursor.execute(sql, params)
-            results = cursor.fetchall()
+        return self._get_or_build(self._cache_key('parking_duration', days), self._build_parking_duration_chart)
+    
+    def _build_parking_duration_chart(self):
+        """Build the average amount by location chart"""
+        results = sorted(self._fetch_all_aggregates().get('org_amount', []), key=lambda row: row[1] or 0, reverse=True)
         
         if results:
             locations = [row[0] for row in results]
-            avg_amounts = [float(row[1]) for row in results]
+            avg_amounts = [float(row[1] or 0) for row in results]
         else:
             locations = ['JKIA', 'KNH', 'Green House Mall']
             avg_amounts = [450, 380, 520]
@@ -112,56 +310,21 @@ class VehicleAnalytics:
             'data': [{
                 'x': locations,
                 'y': avg_amounts,
-                'type': 'bar',
-                'name': 'Average Amount Paid',
-                'marker': {'color': '#3b82f6'}
+                **_PARKING_TRACE
             }],
-            'layout': {
-                'title': 'Average Amount Paid by Location',
-                'xaxis': {'title': 'Location'},
-                'yaxis': {'title': 'Average Amount (KSh)'},
-                'template': 'plotly_white',
-                'height': 400
-            }
+            'layout': _PARKING_LAYOUT
         }
         
-        cache.set(cache_key, result, 300)
         return result
     
     def get_hourly_entries_chart(self, organization=None):
         """Generate hourly entries chart data for Plotly.js"""
-        cache_key = f'hourly_entries_{self.organization.id if self.organization else "all"}_{self.vehicle_brand}_{self.vehicle_type}'
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-        
-        filters, params = self._get_base_filters()
-        
-        # Build WHERE clause
-        where_clauses = ["1=1"]
-        if filters:
-            where_clauses.append(filters)
-        where_clauses.append("entry_hour IS NOT NULL")
-        base_where = " AND ".join(where_clauses)
-        
-        # Query actual hourly entry data from combined_dataset using entry_hour column
-        try:
-            with connection.cursor() as cursor:
-                sql = f"""
-                    SELECT entry_hour, COUNT(*) as entry_count
-                    FROM combined_dataset 
-                    WHERE {base_where}
-                    GROUP BY entry_hour 
-                    ORDER BY entry_hour
-                """
-                cursor.execute(sql, params)
-                results = cursor.fetchall()
-        except Exception:
-            # If entry_hour column doesn't exist or query fails, return empty data
-            results = []
-        
+        return self._get_or_build(self._cache_key('hourly_entries'), self._build_hourly_entries_chart)
+    
+    def _build_hourly_entries_chart(self):
+        """Build the hourly entries chart"""
         # Prepare data for all 24 hours
-        hour_counts = {row[0]: row[1] for row in results if row[0] is not None}
+        hour_counts = {int(row[0]): int(row[1]) for row in self._fetch_all_aggregates().get('hourly', [])}
         hours = list(range(0, 24))
         entries = [hour_counts.get(hour, 0) for hour in hours]
         
@@ -170,109 +333,50 @@ class VehicleAnalytics:
             'data': [{
                 'x': hours,
                 'y': entries,
-                'type': 'scatter',
-                'mode': 'lines+markers',
-                'name': 'Vehicle Entries',
-                'line': {'color': '#16a34a', 'width': 3},
-                'marker': {'size': 6}
+                **_HOURLY_TRACE
             }],
-            'layout': {
-                'title': 'Hourly Vehicle Entries Pattern',
-                'xaxis': {'title': 'Hour of Day'},
-                'yaxis': {'title': 'Number of Vehicles'},
-                'template': 'plotly_white',
-                'height': 400,
-                'showlegend': False
-            }
+            'layout': _HOURLY_LAYOUT
         }
         
-        cache.set(cache_key, result, 300)
         return result
     
     def get_vehicles_per_site_chart(self, organization=None):
         """Generate vehicles per location pie chart data for Plotly.js"""
-        cache_key = f'vehicles_per_site_{self.organization.id if self.organization else "all"}_{self.vehicle_brand}_{self.vehicle_type}'
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-        
-        filters, params = self._get_base_filters()
+        return self._get_or_build(self._cache_key('vehicles_per_site'), self._build_vehicles_per_site_chart)
+    
+    def _build_vehicles_per_site_chart(self):
+        """Build the vehicles per location chart"""
+        results = sorted(self._fetch_all_aggregates().get('org_vehicles', []), key=lambda row: row[1] or 0, reverse=True)
         
         if self.organization:
-            with connection.cursor() as cursor:
-                sql = 'SELECT COUNT(DISTINCT "Plate Number") FROM combined_dataset WHERE "Organization" = %s'
-                cursor.execute(sql, [self.organization.name])
-                count = cursor.fetchone()[0]
             locations = [self.organization.name]
-            vehicle_counts = [count]
+            vehicle_counts = [int(results[0][1]) if results else 0]
+        elif results:
+            locations = [row[0] for row in results]
+            vehicle_counts = [int(row[1]) for row in results]
         else:
-            base_where = "1=1"
-            if filters:
-                base_where += f" AND {filters}"
-            
-            with connection.cursor() as cursor:
-                sql = """
-                    SELECT "Organization", COUNT(DISTINCT "Plate Number") as vehicles
-                    FROM combined_dataset 
-                    WHERE """ + base_where + """
-                    GROUP BY "Organization" 
-                    ORDER BY vehicles DESC
-                """
-                cursor.execute(sql, params)
-                results = cursor.fetchall()
-            
-            if results:
-                locations = [row[0] for row in results]
-                vehicle_counts = [row[1] for row in results]
-            else:
-                locations = ['JKIA', 'KNH', 'Green House Mall']
-                vehicle_counts = [1250, 890, 1100]
+            locations = ['JKIA', 'KNH', 'Green House Mall']
+            vehicle_counts = [1250, 890, 1100]
         
         # Return data in format expected by Plotly.js
         result = {
             'data': [{
                 'labels': locations,
                 'values': vehicle_counts,
-                'type': 'pie',
-                'name': 'Vehicles',
-                'hovertemplate': '<b>%{label}</b><br>Vehicles: %{value}<br>Percentage: %{percent}<extra></extra>',
-                'textinfo': 'label+percent',
-                'textposition': 'auto'
+                **_SITE_VEHICLES_TRACE
             }],
-            'layout': {
-                'title': 'Vehicle Distribution by Location',
-                'template': 'plotly_white',
-                'height': 400,
-                'showlegend': True
-            }
+            'layout': _SITE_VEHICLES_LAYOUT
         }
         
-        cache.set(cache_key, result, 300)
         return result
     
     def get_revenue_per_site_chart(self, organization=None):
         """Generate revenue chart data for Plotly.js"""
-        cache_key = f'revenue_per_site_{self.organization.id if self.organization else "all"}_{self.vehicle_brand}_{self.vehicle_type}'
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-        
-        filters, params = self._get_base_filters()
-        base_where = '"Amount Paid" > 0'
-        
-        if filters:
-            base_where += f" AND {filters}"
-        
-        with connection.cursor() as cursor:
-            sql = """
-                SELECT "Organization", SUM("Amount Paid") as total_revenue
-                FROM combined_dataset 
-                WHERE """ + base_where + """
-                GROUP BY "Organization" 
-                ORDER BY total_revenue DESC
-            """
-            cursor.execute(sql, params)
-            results = cursor.fetchall()
+        return self._get_or_build(self._cache_key('revenue_per_site'), self._build_revenue_per_site_chart)
+    
+    def _build_revenue_per_site_chart(self):
+        """Build the revenue per location chart"""
+        results = sorted(self._fetch_all_aggregates().get('org_revenue', []), key=lambda row: row[1] or 0, reverse=True)
         
         if results:
             locations = [row[0] for row in results]
@@ -286,200 +390,158 @@ class VehicleAnalytics:
             'data': [{
                 'x': locations,
                 'y': revenues,
-                'type': 'bar',
-                'name': 'Revenue',
-                'marker': {'color': '#16a34a'},
-                'hovertemplate': '<b>%{x}</b><br>Revenue: KSh %{y:,.0f}<extra></extra>'
+                **_SITE_REVENUE_TRACE
             }],
-            'layout': {
-                'title': 'Revenue per Location',
-                'xaxis': {'title': 'Location'},
-                'yaxis': {'title': 'Revenue (KSh)', 'type': 'log'},
-                'template': 'plotly_white',
-                'height': 400,
-                'showlegend': False
-            }
+            'layout': _SITE_REVENUE_LAYOUT
         }
         
-        cache.set(cache_key, result, 300)
         return result
     
     def get_visit_patterns_chart(self, organization=None):
         """Generate visit patterns chart data for Plotly.js"""
-        cache_key = f'visit_patterns_{self.organization.id if self.organization else "all"}_{self.vehicle_brand}_{self.vehicle_type}'
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-        
-        filters, params = self._get_base_filters()
-        base_where = "1=1"
-        
-        if filters:
-            base_where += f" AND {filters}"
-        
-        # Query actual visit frequency data from combined_dataset
-        with connection.cursor() as cursor:
-            # Calculate visit frequency from Plate Number counts (more reliable)
-            # Use a simpler approach that works reliably
-            sql = """
-                SELECT "Plate Number", COUNT(*) as visit_count
-                FROM combined_dataset 
-                WHERE """ + base_where + """
-                GROUP BY "Plate Number"
-            """
-            try:
-                cursor.execute(sql, params)
-                all_results = cursor.fetchall()
-                
-                # Group manually in Python
-                groups = {'1': 0, '2-3': 0, '4-5': 0, '6-10': 0, '10+': 0}
-                for row in all_results:
-                    count = row[1]
-                    if count == 1:
-                        groups['1'] += 1
-                    elif 2 <= count <= 3:
-                        groups['2-3'] += 1
-                    elif 4 <= count <= 5:
-                        groups['4-5'] += 1
-                    elif 6 <= count <= 10:
-                        groups['6-10'] += 1
-                    else:
-                        groups['10+'] += 1
-                
-                # Return in order
-                results = [
-                    ('1', groups['1']),
-                    ('2-3', groups['2-3']),
-                    ('4-5', groups['4-5']),
-                    ('6-10', groups['6-10']),
-                    ('10+', groups['10+'])
-                ]
-            except Exception as e:
-                # If query fails, return empty results
-                results = []
-        
-        if results:
-            visit_groups = [row[0] for row in results]
-            vehicle_counts = [row[1] for row in results]
-        else:
-            visit_groups = ['1', '2-3', '4-5', '6-10', '10+']
-            vehicle_counts = [0, 0, 0, 0, 0]
+        return self._get_or_build(self._cache_key('visit_patterns'), self._build_visit_patterns_chart)
+    
+    def _build_visit_patterns_chart(self):
+        """Build the visit patterns chart"""
+        # Plates are bucketed by visit count in SQL; only the five buckets come back
+        group_counts = {row[0]: int(row[1]) for row in self._fetch_all_aggregates().get('visits', [])}
+        visit_groups = list(VISIT_GROUPS)
+        vehicle_counts = [group_counts.get(group, 0) for group in visit_groups]
         
         # Return data in format expected by Plotly.js
         result = {
             'data': [{
                 'x': visit_groups,
                 'y': vehicle_counts,
-                'type': 'bar',
-                'name': 'Vehicle Count',
-                'marker': {'color': '#3b82f6'}
+                **_VISIT_PATTERNS_TRACE
             }],
-            'layout': {
-                'title': 'Vehicle Visit Patterns',
-                'xaxis': {'title': 'Number of Visits'},
-                'yaxis': {'title': 'Number of Vehicles'},
-                'template': 'plotly_white',
-                'height': 400,
-                'showlegend': False
-            }
+            'layout': _VISIT_PATTERNS_LAYOUT
         }
         
-        cache.set(cache_key, result, 300)
         return result
     
     def get_avg_stay_by_type_chart(self, organization=None):
         """Generate average stay by vehicle type chart data for Plotly.js"""
-        cache_key = f'avg_stay_by_type_{self.organization.id if self.organization else "all"}_{self.vehicle_brand}_{self.vehicle_type}'
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            return cached_result
-        
-        filters, params = self._get_base_filters()
-        base_where = '"Amount Paid" > 0'
-        
-        if filters:
-            base_where += f" AND {filters}"
-        
-        with connection.cursor() as cursor:
-            # Try using duration_minutes column (feature column)
-            try:
-                sql = """
-                    SELECT "Vehicle Type", 
-                           AVG(COALESCE(duration_minutes, 0)) as avg_duration,
-                           COUNT(*) as total_visits
-                    FROM combined_dataset 
-                    WHERE """ + base_where + """
-                    GROUP BY "Vehicle Type" 
-                    ORDER BY avg_duration DESC
-                """
-                cursor.execute(sql, params)
-                results = cursor.fetchall()
-            except Exception:
-                # If duration_minutes doesn't exist, use parking_duration_minutes or return empty
-                try:
-                    sql = f"""
-                        SELECT "Vehicle Type", 
-                               AVG(COALESCE(parking_duration_minutes, 0)) as avg_duration_minutes,
-                               COUNT(*) as total_visits
-                        FROM combined_dataset 
-                        WHERE {base_where} AND parking_duration_minutes IS NOT NULL
-                        GROUP BY "Vehicle Type" 
-                        ORDER BY avg_duration_minutes DESC
-                    """
-                    cursor.execute(sql, params)
-                    results = cursor.fetchall()
-                except Exception:
-                    # If no duration column exists, return empty results
-                    results = []
+        return self._get_or_build(self._cache_key('avg_stay_by_type'), self._build_avg_stay_by_type_chart)
+    
+    def _build_avg_stay_by_type_chart(self):
+        """Build the average stay by vehicle type chart"""
+        results = sorted(self._fetch_all_aggregates().get('type_duration', []), key=lambda row: row[1] or 0, reverse=True)
         
-        if results:
-            vehicle_types = [row[0] if row[0] else 'Unknown' for row in results]
-            avg_durations = [float(row[1] or 0) for row in results]
-        else:
-            vehicle_types = []
-            avg_durations = []
+        vehicle_types = [row[0] if row[0] else 'Unknown' for row in results]
+        avg_durations = [float(row[1] or 0) for row in results]
         
         # Return data in format expected by Plotly.js
         result = {
             'data': [{
                 'x': vehicle_types,
                 'y': avg_durations,
-                'type': 'bar',
-                'name': 'Average Duration',
-                'marker': {'color': '#f59e0b'}
+                **_AVG_STAY_TRACE
             }],
-            'layout': {
-                'title': 'Average Stay Duration by Vehicle Type',
-                'xaxis': {'title': 'Vehicle Type'},
-                'yaxis': {'title': 'Average Duration (Minutes)'},
-                'template': 'plotly_white',
-                'height': 400,
-                'showlegend': False
-            }
+            'layout': _AVG_STAY_LAYOUT
         }
         
-        cache.set(cache_key, result, 300)
         return result
     
     def get_analytics_summary(self, organization=None):
         """Get complete analytics summary"""
-        return {
-            'fleet_summary': self.get_fleet_summary(),
-            'parking_duration_chart': self.get_parking_duration_chart(),
-            'hourly_entries_chart': self.get_hourly_entries_chart(organization),
-            'vehicles_per_site_chart': self.get_vehicles_per_site_chart(organization),
-            'revenue_per_site_chart': self.get_revenue_per_site_chart(organization),
-            'visit_patterns_chart': self.get_visit_patterns_chart(organization),
-            'avg_stay_by_type_chart': self.get_avg_stay_by_type_chart(organization)
+        charts = {
+            'fleet_summary': (self._cache_key('fleet_summary', 30), self._build_fleet_summary),
+            'parking_duration_chart': (self._cache_key('parking_duration', 30), self._build_parking_duration_chart),
+            'hourly_entries_chart': (self._cache_key('hourly_entries'), self._build_hourly_entries_chart),
+            'vehicles_per_site_chart': (self._cache_key('vehicles_per_site'), self._build_vehicles_per_site_chart),
+            'revenue_per_site_chart': (self._cache_key('revenue_per_site'), self._build_revenue_per_site_chart),
+            'visit_patterns_chart': (self._cache_key('visit_patterns'), self._build_visit_patterns_chart),
+            'avg_stay_by_type_chart': (self._cache_key('avg_stay_by_type'), self._build_avg_stay_by_type_chart)
         }
+        
+        # One round trip for the warm path; only missing charts are built (sharing the fused query)
+        cached = _tiered_get_many([key for key, _ in charts.values() if key not in self._results])
+        cached.update(self._results)
+        summary = {}
+        missing = {}
+        for name, (key, build) in charts.items():
+            if key in cached:
+                summary[name] = cached[key]
+            else:
+                summary[name] = missing[key] = build()
+        
+        if missing:
+            _tiered_set_many(missing, 300)
+        self._results.update((key, summary[name]) for name, (key, _) in charts.items())
+        return summary
+    
+    def get_driver_performance(self, days=30, limit=50):
+        """Get driver performance analytics, every metric from one grouped aggregate"""
+        trips = VehicleMovement.objects.filter(
+            start_time__gte=timezone.now() - timedelta(days=days),
+            trip_status='completed',
+            driver__isnull=False
+        )
+        if self.organization:
+            trips = trips.filter(vehicle__organization=self.organization)
+        if self.vehicle_brand:
+            trips = trips.filter(vehicle__make=self.vehicle_brand)
+        
+        drivers = trips.values(
+            'driver_id', 'driver__first_name', 'driver__last_name', 'driver__username'
+        ).annotate(
+            total_trips=Count('id'),
+            total_duration=Sum('duration_minutes'),
+            avg_duration=Avg('duration_minutes'),
+            total_distance=Sum('distance_km'),
+            total_fuel=Sum('fuel_consumed_liters'),
+            avg_speed=Avg('average_speed_kmh'),
+            active_days=Count(TruncDate('start_time'), distinct=True)
+        ).order_by('-total_trips')[:limit]
+        
+        return [self._driver_row(driver) for driver in drivers]
     
-    def get_driver_performance(self, days=30):
-        """Get driver performance analytics"""
-        return []
+    @staticmethod
+    def _driver_row(driver):
+        """Shape one grouped driver aggregate for the templates"""
+        full_name = f"{driver['driver__first_name']} {driver['driver__last_name']}".strip()
+        total_distance = float(driver['total_distance'] or 0)
+        total_fuel = float(driver['total_fuel'] or 0)
+        return {
+            'driver_id': driver['driver_id'],
+            'driver_name': full_name or driver['driver__username'],
+            'total_trips': driver['total_trips'],
+            'total_duration': driver['total_duration'] or 0,
+            'avg_duration': float(driver['avg_duration'] or 0),
+            'total_distance': total_distance,
+            'avg_speed': float(driver['avg_speed'] or 0),
+            'fuel_efficiency': total_distance / total_fuel if total_fuel else 0,
+            'active_days': driver['active_days']
+        }
     
     def get_route_analysis(self, days=30):
-        """Analyze most frequent routes"""
-        return []
+        """Analyze most frequent routes, grouped and ranked in the database"""
+        trips = VehicleMovement.objects.filter(
+            start_time__gte=timezone.now() - timedelta(days=days),
+            trip_status='completed'
+        ).exclude(start_location='').exclude(end_location='')
+        if self.organization:
+            trips = trips.filter(vehicle__organization=self.organization)
+        if self.vehicle_brand:
+            trips = trips.filter(vehicle__make=self.vehicle_brand)
+        
+        flows = trips.values('start_location', 'end_location').annotate(
+            frequency=Count('id'),
+            avg_duration=Avg('duration_minutes'),
+            avg_distance=Avg('distance_km'),
+            total_fuel=Sum('fuel_consumed_liters')
+        ).order_by('-frequency')[:10]
+        
+        return [{
+            'route': f"{flow['start_location']} → {flow['end_location']}",
+            'start_location': flow['start_location'],
+            'end_location': flow['end_location'],
+            'frequency': flow['frequency'],
+            'avg_duration': float(flow['avg_duration'] or 0),
+            'avg_distance': float(flow['avg_distance'] or 0),
+            'total_fuel': float(flow['total_fuel'] or 0)
+        } for flow in flows]
     
     def get_cost_analysis(self, days=30):
         """Analyze fleet costs"""
@@ -488,4 +550,74 @@ class VehicleAnalytics:
             'trip_fuel_cost': 0,
             'total_trips': 0,
             'cost_per_trip': 0
-        }
\ No newline at end of file
+        }
+
+
+_SAMPLE_MAKES = ['Toyota', 'Nissan', 'Mazda', 'Honda', 'Subaru']
+_SAMPLE_MODELS = ['Corolla', 'Camry', 'Prius', 'Civic', 'Accord']
+_SAMPLE_FUEL_TYPES = ['gasoline', 'diesel', 'hybrid', 'electric']
+_SAMPLE_LOCATIONS = ['JKIA', 'KNH', 'Green House Mall', 'Westgate', 'CBD']
+
+
+def generate_sample_data(organization, vehicle_count=10, movement_count=500):
+    """Create sample vehicles and trips for an organization in two bulk inserts"""
+    # Unique per run so repeated generation never collides on vehicle_id/vin/trip_id
+    batch = uuid.uuid4().hex[:8].upper()
+    now = timezone.now()
+    
+    with transaction.atomic():
+        vehicles = Vehicle.objects.bulk_create([
+            Vehicle(
+                vehicle_id=f'VH-{batch}-{i + 1:03d}',
+                make=random.choice(_SAMPLE_MAKES),
+                model=random.choice(_SAMPLE_MODELS),
+                year=random.randint(2015, 2023),
+                vin=f'{batch}{i + 1:09d}',
+                license_plate=f'KC{chr(65 + i % 26)} {random.randint(100, 999)}{chr(65 + (i // 26) % 26)}',
+                fuel_type=random.choice(_SAMPLE_FUEL_TYPES),
+                organization=organization
+            )
+            for i in range(vehicle_count)
+        ])
+        
+        drivers = list(CustomUser.objects.filter(organization=organization)) or [None]
+        trip_vehicles = random.choices(vehicles, k=movement_count)
+        trip_drivers = random.choices(drivers, k=movement_count)
+        
+        # Draw every trip's random fields as whole arrays
+        rng = np.random.default_rng()
+        start_offsets = rng.integers(0, 30 * 24 * 60, size=movement_count).tolist()
+        durations = rng.integers(30, 481, size=movement_count).tolist()
+        locations = rng.choice(_SAMPLE_LOCATIONS, size=(movement_count, 2)).tolist()
+        distances = rng.uniform(5, 50, size=movement_count)
+        fuel_liters = distances * rng.uniform(0.08, 0.3, size=movement_count)
+        fuel_costs = fuel_liters * rng.uniform(90, 110, size=movement_count)
+        avg_speeds = rng.uniform(20, 80, size=movement_count)
+        max_speeds = avg_speeds * rng.uniform(1.2, 1.5, size=movement_count)
+        metrics = np.round(np.column_stack([distances, fuel_liters, fuel_costs, avg_speeds, max_speeds]), 2).tolist()
+        
+        movements = []
+        for i, (vehicle, driver, offset, duration, (start_location, end_location), trip_metrics) in enumerate(
+            zip(trip_vehicles, trip_drivers, start_offsets, durations, locations, metrics)
+        ):
+            distance, liters, fuel_cost, avg_speed, max_speed = trip_metrics
+            start_time = now - timedelta(minutes=offset)
+            movements.append(VehicleMovement(
+                vehicle=vehicle,
+                driver=driver,
+                trip_id=f'TRIP-{batch}-{i + 1:06d}',
+                start_location=start_location,
+                end_location=end_location,
+                start_time=start_time,
+                end_time=start_time + timedelta(minutes=duration),
+                duration_minutes=duration,
+                distance_km=distance,
+                fuel_consumed_liters=liters,
+                fuel_cost=fuel_cost,
+                average_speed_kmh=avg_speed,
+                max_speed_kmh=max_speed,
+                trip_status='completed'
+            ))
+        VehicleMovement.objects.bulk_create(movements, batch_size=500)
+    
+    return f'Created {len(vehicles)} vehicles and {len(movements)} trips'
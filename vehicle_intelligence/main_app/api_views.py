@@ -1,9 +1,33 @@
+from django.db import connection, transaction
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 import json
-from .models import ParkingRecord
+from .models import ParkingRecord, OrganizationAnalyticsRollup
+from .signals import bump_parking_cache_versions
+
+# Closes a plate's latest open session in one statement; the duration is
+# computed in the database and the subquery uses the active-plate index.
+# The previous amount is returned so the rollup can take the difference.
+_CLOSE_SESSION_SQL = f'''
+    WITH target AS (
+        SELECT id, amount_paid FROM {ParkingRecord._meta.db_table}
+        WHERE plate_number = %s AND parking_status = 'active'
+        ORDER BY entry_time DESC
+        LIMIT 1
+        FOR UPDATE
+    )
+    UPDATE {ParkingRecord._meta.db_table} AS r
+    SET exit_time = %s,
+        amount_paid = %s,
+        payment_method = %s,
+        parking_duration_minutes = EXTRACT(EPOCH FROM (%s - r.entry_time)) / 60,
+        parking_status = 'completed'
+    FROM target
+    WHERE r.id = target.id
+    RETURNING r.organization, r.plate_number, r.amount_paid, target.amount_paid
+'''
 
 @csrf_exempt
 @require_POST
@@ -32,17 +56,29 @@ def update_parking_exit(request):
     try:
         data = json.loads(request.body)
         
-        record = ParkingRecord.objects.get(
-            plate_number=data['plate_number'],
-            parking_status='active'
-        )
+        exit_time = timezone.now()
         
-        record.exit_time = timezone.now()
-        record.amount_paid = data.get('amount_paid', 0)
-        record.payment_method = data.get('payment_method', 'Cash')
-        record.parking_duration_minutes = (record.exit_time - record.entry_time).total_seconds() / 60
-        record.parking_status = 'completed'
-        record.save()
+        # The close and the rollup change commit together; caches move on only after that
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(_CLOSE_SESSION_SQL, [
+                    data['plate_number'],
+                    exit_time,
+                    data.get('amount_paid', 0),
+                    data.get('payment_method', 'Cash'),
+                    exit_time
+                ])
+                row = cursor.fetchone()
+            
+            if row is None:
+                return JsonResponse({'success': False, 'error': 'No active parking session for this plate'}, status=404)
+            
+            # The raw UPDATE sends no post_save, so do what its handlers would
+            organization, plate_number, amount_paid, previous_amount = row
+            OrganizationAnalyticsRollup.apply_delta(
+                organization, plate_number, 0, (amount_paid or 0) - (previous_amount or 0), 0, 0
+            )
+            transaction.on_commit(bump_parking_cache_versions)
         
         return JsonResponse({'success': True})
     except Exception as e:
@@ -1,15 +1,48 @@
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from django.core.management import call_command
+from django.db import connections
+from .management.commands.load_excel_data import ingest_file
+
+# Seconds between size checks while waiting for a new file to finish writing
+STABLE_CHECK_INTERVAL = 1
+STABLE_CHECK_LIMIT = 60
+
+# One worker so files are loaded in arrival order and never race each other
+_ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='excel-ingest')
+
+
+def _wait_until_written(path):
+    """Block until the file size stops changing, or the check limit runs out"""
+    last_size = -1
+    for _ in range(STABLE_CHECK_LIMIT):
+        size = os.path.getsize(path)
+        if size == last_size and size > 0:
+            return
+        last_size = size
+        time.sleep(STABLE_CHECK_INTERVAL)
+
+
+def _ingest_new_file(path):
+    """Load just the new file once it has been fully written"""
+    try:
+        _wait_until_written(path)
+        created, skipped, rows = ingest_file(path)
+        print(f"Loaded {path}: {created} new records, {skipped} skipped of {rows} rows")
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+    finally:
+        connections.close_all()
+
 
 class ExcelFileHandler(FileSystemEventHandler):
     def on_created(self, event):
-        if event.is_file and event.src_path.endswith('.xlsx'):
+        if not event.is_directory and event.src_path.endswith('.xlsx'):
             print(f"New Excel file detected: {event.src_path}")
-            time.sleep(2)  # Wait for file to be fully written
-            call_command('load_excel_data')
+            # Hand off so the observer thread never waits on the write or the load
+            _ingest_executor.submit(_ingest_new_file, event.src_path)
 
 def start_file_watcher():
     event_handler = ExcelFileHandler()
@@ -17,4 +50,4 @@ def start_file_watcher():
     observer.schedule(event_handler, path='Data', recursive=False)
     observer.start()
     print("File watcher started for Data folder")
-    return observer
\ No newline at end of file
+    return observer
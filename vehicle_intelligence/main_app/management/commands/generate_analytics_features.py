@@ -1,8 +1,35 @@
 from django.core.management.base import BaseCommand
 from django.db import connection
+from main_app.signals import REAL_ANALYTICS_VERSION_CACHE_KEY, bump_cache_version
 import random
 from datetime import datetime, timedelta
 
+# combined_dataset rows are streamed and enhanced rows written in batches of
+# this size, so memory stays bounded however large the table is
+CHUNK_SIZE = 2000
+
+INSERT_SQL = '''
+    INSERT INTO real_movement_analytics (
+        plate_number, vehicle_brand, vehicle_type, organization,
+        entry_time, exit_time, amount_paid, payment_method, plate_color,
+        duration_minutes, duration_category, revenue_category,
+        visit_frequency, efficiency_score, peak_hour, business_hours,
+        weekend, season, month_name, hour_of_day, day_of_week,
+        vehicle_usage_type, vehicle_revenue_tier, vehicle_visit_count,
+        vehicle_total_revenue, org_capacity_score, customer_loyalty_score
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+'''
+
+
+def iter_rows(cursor, chunk_size=CHUNK_SIZE):
+    """Yield a cursor's rows, fetching chunk_size at a time"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
 class Command(BaseCommand):
     help = 'Generate real_movement_analytics table with feature engineering from combined_dataset'
 
@@ -48,8 +75,9 @@ class Command(BaseCommand):
                     )
                 ''')
                 
-                # Get data from combined_dataset
-                cursor.execute('''
+                # Stream data from combined_dataset through a server-side cursor
+                source = connection.chunked_cursor()
+                source.execute('''
                     SELECT 
                         "Plate Number",
                         "Vehicle Brand", 
@@ -64,15 +92,15 @@ class Command(BaseCommand):
                     ORDER BY "Entry Time"
                 ''')
                 
-                records = cursor.fetchall()
-                self.stdout.write(f'Processing {len(records)} records...')
+                self.stdout.write('Processing records...')
                 
                 # Generate enhanced records with feature engineering
                 enhanced_records = []
+                records_processed = 0
                 vehicle_stats = {}
                 org_stats = {}
                 
-                for i, record in enumerate(records):
+                for record in iter_rows(source):
                     plate_number = record[0]
                     vehicle_brand = record[1] or 'Unknown'
                     vehicle_type = record[2] or 'Car'
@@ -180,20 +208,17 @@ class Command(BaseCommand):
                         vehicle_usage_type, vehicle_revenue_tier, visit_count,
                         total_revenue, org_capacity_score, customer_loyalty_score
                     ))
+                    records_processed += 1
+                    
+                    if len(enhanced_records) >= CHUNK_SIZE:
+                        cursor.executemany(INSERT_SQL, enhanced_records)
+                        enhanced_records.clear()
                 
-                # Insert enhanced records
-                self.stdout.write('Inserting enhanced records...')
-                cursor.executemany('''
-                    INSERT INTO real_movement_analytics (
-                        plate_number, vehicle_brand, vehicle_type, organization,
-                        entry_time, exit_time, amount_paid, payment_method, plate_color,
-                        duration_minutes, duration_category, revenue_category,
-                        visit_frequency, efficiency_score, peak_hour, business_hours,
-                        weekend, season, month_name, hour_of_day, day_of_week,
-                        vehicle_usage_type, vehicle_revenue_tier, vehicle_visit_count,
-                        vehicle_total_revenue, org_capacity_score, customer_loyalty_score
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ''', enhanced_records)
+                source.close()
+                
+                # Insert the last partial batch
+                cursor.executemany(INSERT_SQL, enhanced_records)
+                self.stdout.write(f'Inserted {records_processed} enhanced records')
                 
                 # Create indexes for better performance
                 cursor.execute('CREATE INDEX idx_real_analytics_plate ON real_movement_analytics(plate_number)')
@@ -202,9 +227,23 @@ class Command(BaseCommand):
                 cursor.execute('CREATE INDEX idx_real_analytics_vehicle_brand ON real_movement_analytics(vehicle_brand)')
                 cursor.execute('CREATE INDEX idx_real_analytics_vehicle_type ON real_movement_analytics(vehicle_type)')
                 
+                # Hourly entry counts read by the hourly entries chart
+                cursor.execute('DROP TABLE IF EXISTS real_hourly_entries')
+                cursor.execute('''
+                    CREATE TABLE real_hourly_entries AS
+                    SELECT organization, hour_of_day, COUNT(*) AS entries
+                    FROM real_movement_analytics
+                    WHERE hour_of_day IS NOT NULL
+                    GROUP BY organization, hour_of_day
+                ''')
+                cursor.execute('CREATE INDEX idx_real_hourly_entries_org ON real_hourly_entries(organization)')
+                
+                # Cached chart JSON was built from the previous table
+                bump_cache_version(REAL_ANALYTICS_VERSION_CACHE_KEY)
+                
                 self.stdout.write(
                     self.style.SUCCESS(
-                        f'Successfully created real_movement_analytics table with {len(enhanced_records)} enhanced records!'
+                        f'Successfully created real_movement_analytics table with {records_processed} enhanced records!'
                     )
                 )
                 
@@ -2,8 +2,139 @@ import os
 import glob
 import pandas as pd
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
-from main_app.models import Organization, ParkingRecord
+from main_app.models import Organization, ParkingRecord, OrganizationAnalyticsRollup
+from main_app.signals import bump_parking_cache_versions
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'Data')
+
+# Rows written per INSERT when loading parking records
+BATCH_SIZE = 1000
+
+# Columns whose database limits a spreadsheet value can exceed; rows that do are
+# skipped like any other bad row rather than failing the whole file's insert
+_VALIDATED_FIELDS = [
+    ParkingRecord._meta.get_field(name)
+    for name in ('plate_number', 'vehicle_type', 'plate_color', 'vehicle_brand',
+                 'amount_paid', 'payment_method', 'organization')
+]
+
+
+def _aware(value):
+    """Timezone-aware datetime for a parsed Excel cell, or None when it is empty"""
+    if pd.isna(value) or value is pd.NaT:
+        return None
+    return timezone.make_aware(value.to_pydatetime()) if hasattr(value, 'to_pydatetime') else timezone.make_aware(value)
+
+
+def read_excel_file(path):
+    """Read one Excel export into a cleaned DataFrame tagged with its organization"""
+    df = pd.read_excel(path)
+    df['Organization'] = os.path.splitext(os.path.basename(path))[0].split('-')[-1]
+
+    # Clean organization names
+    df['Organization'] = df['Organization'].replace('1st December United Mall', 'United Mall', regex=True)
+
+    # Clean column names
+    df.columns = (
+        df.columns
+        .str.replace(r"\(Kenyan Time\)", "", regex=True)
+        .str.strip()
+        .str.title()
+    )
+
+    # Convert time columns to datetime
+    for col in ("Entry Time", "Exit Time", "Payment Time"):
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+
+    return df
+
+
+def ingest_file(path, log=print):
+    """Load a single Excel file, inserting only rows not already in the database"""
+    df = read_excel_file(path)
+
+    for org_name in df['Organization'].unique():
+        org, created = Organization.objects.get_or_create(
+            name=org_name,
+            defaults={
+                'slug': org_name.lower().replace(' ', '-'),
+                'email': f'admin@{org_name.lower().replace(" ", "")}.com',
+                'is_active': True
+            }
+        )
+        if created:
+            log(f'Created organization: {org_name}')
+
+    # Existing (plate, entry, organization) keys for this file's organizations and
+    # time span, fetched once instead of one exists() query per row
+    entry_times = df['Entry Time'].dropna()
+    existing = set()
+    if not entry_times.empty:
+        existing = set(ParkingRecord.objects.filter(
+            organization__in=[str(name) for name in df['Organization'].unique()],
+            entry_time__range=(_aware(entry_times.min()), _aware(entry_times.max()))
+        ).values_list('plate_number', 'entry_time', 'organization'))
+
+    records = []
+    skipped_records = 0
+    for index, row in enumerate(df.to_dict('records')):
+        try:
+            entry_time = _aware(row.get('Entry Time'))
+            if entry_time is None:
+                skipped_records += 1
+                continue
+
+            exit_time = _aware(row.get('Exit Time'))
+            payment_time = _aware(row.get('Payment Time'))
+
+            parking_duration = 0
+            if exit_time:
+                parking_duration = (exit_time - entry_time).total_seconds() / 60
+
+            plate_number = str(row.get('Plate Number', ''))
+            organization = str(row.get('Organization', 'Unknown'))
+
+            # Skip if record already exists, in the database or earlier in this file
+            key = (plate_number, entry_time, organization)
+            if key in existing:
+                skipped_records += 1
+                continue
+
+            record = ParkingRecord(
+                plate_number=plate_number,
+                entry_time=entry_time,
+                exit_time=exit_time,
+                vehicle_type=str(row.get('Vehicle Type', 'Unknown')),
+                plate_color=str(row.get('Plate Color', 'Unknown')),
+                vehicle_brand=str(row.get('Vehicle Brand', 'Unknown')),
+                amount_paid=float(row.get('Amount Paid', 0) or 0),
+                payment_time=payment_time,
+                payment_method=str(row.get('Payment Method', 'Unknown')),
+                organization=organization,
+                parking_duration_minutes=int(parking_duration),
+                parking_status='completed' if exit_time else 'active'
+            )
+            for field in _VALIDATED_FIELDS:
+                field.run_validators(field.to_python(getattr(record, field.attname)))
+            existing.add(key)
+            records.append(record)
+        except Exception as e:
+            log(f'Error processing row {index}: {e}')
+            continue
+
+    if records:
+        # The file's rows and the rollups they feed land together or not at all
+        with transaction.atomic():
+            ParkingRecord.objects.bulk_create(records, batch_size=BATCH_SIZE)
+            # bulk_create sends no post_save, so do the signal handlers' work once per file
+            for organization in {record.organization for record in records}:
+                OrganizationAnalyticsRollup.refresh(organization)
+        bump_parking_cache_versions()
+
+    return len(records), skipped_records, len(df)
 
 
 class Command(BaseCommand):
@@ -11,133 +142,32 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         self.stdout.write('Starting data preprocessing...')
-        
+
         # Get Excel files from Data folder
-        data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'Data')
-        excel_files = glob.glob(os.path.join(data_path, "*.xlsx"))
-        
+        excel_files = glob.glob(os.path.join(DATA_PATH, "*.xlsx"))
+
         if not excel_files:
-            self.stdout.write(self.style.ERROR(f'No Excel files found in {data_path}'))
+            self.stdout.write(self.style.ERROR(f'No Excel files found in {DATA_PATH}'))
             return
-        
+
         self.stdout.write(f'Found {len(excel_files)} Excel files')
-        
-        # Combine all Excel files
-        df_list = []
-        for file in excel_files:
-            self.stdout.write(f'Processing: {os.path.basename(file)}')
-            df = pd.read_excel(file)
-            location_name = os.path.splitext(os.path.basename(file))[0].split('-')[-1]
-            df['Organization'] = location_name
-            df_list.append(df)
-        
-        master_df = pd.concat(df_list, ignore_index=True)
-        
-        # Clean organization names
-        master_df['Organization'].replace('1st December United Mall', 'United Mall', regex=True, inplace=True)
-        
-        # Clean column names
-        master_df.columns = (
-            master_df.columns
-            .str.replace(r"\(Kenyan Time\)", "", regex=True)
-            .str.strip()
-            .str.title()
-        )
-        
-        self.stdout.write(f'Combined dataset shape: {master_df.shape}')
-        
-        # Convert time columns to datetime
-        time_cols = ["Entry Time", "Exit Time", "Payment Time"]
-        for col in time_cols:
-            if col in master_df.columns:
-                master_df[col] = pd.to_datetime(master_df[col], errors="coerce")
-        
-        # Create organizations
-        organizations = {}
-        for org_name in master_df['Organization'].unique():
-            org, created = Organization.objects.get_or_create(
-                name=org_name,
-                defaults={
-                    'slug': org_name.lower().replace(' ', '-'),
-                    'email': f'admin@{org_name.lower().replace(" ", "")}.com',
-                    'is_active': True
-                }
-            )
-            organizations[org_name] = org
-            if created:
-                self.stdout.write(f'Created organization: {org_name}')
-        
-        # Create parking records
+
         records_created = 0
         skipped_records = 0
-        for index, row in master_df.iterrows():
-            try:
-                # Parse datetime fields
-                entry_time_raw = row.get('Entry Time')
-                exit_time_raw = row.get('Exit Time')
-                payment_time_raw = row.get('Payment Time')
-                
-                if pd.isna(entry_time_raw) or entry_time_raw is pd.NaT:
-                    skipped_records += 1
-                    continue
-                
-                entry_time = timezone.make_aware(entry_time_raw.to_pydatetime()) if hasattr(entry_time_raw, 'to_pydatetime') else timezone.make_aware(entry_time_raw)
-                
-                exit_time = None
-                if not pd.isna(exit_time_raw) and exit_time_raw is not pd.NaT:
-                    exit_time = timezone.make_aware(exit_time_raw.to_pydatetime()) if hasattr(exit_time_raw, 'to_pydatetime') else timezone.make_aware(exit_time_raw)
-                
-                payment_time = None
-                if not pd.isna(payment_time_raw) and payment_time_raw is not pd.NaT:
-                    payment_time = timezone.make_aware(payment_time_raw.to_pydatetime()) if hasattr(payment_time_raw, 'to_pydatetime') else timezone.make_aware(payment_time_raw)
-                
-                parking_duration = 0
-                if exit_time:
-                    parking_duration = (exit_time - entry_time).total_seconds() / 60
-                
-                plate_number = str(row.get('Plate Number', ''))
-                organization = str(row.get('Organization', 'Unknown'))
-                
-                # Skip if record already exists
-                if ParkingRecord.objects.filter(
-                    plate_number=plate_number,
-                    entry_time=entry_time,
-                    organization=organization
-                ).exists():
-                    skipped_records += 1
-                    continue
-                
-                # Create new record
-                record = ParkingRecord.objects.create(
-                    plate_number=plate_number,
-                    entry_time=entry_time,
-                    exit_time=exit_time,
-                    vehicle_type=str(row.get('Vehicle Type', 'Unknown')),
-                    plate_color=str(row.get('Plate Color', 'Unknown')),
-                    vehicle_brand=str(row.get('Vehicle Brand', 'Unknown')),
-                    amount_paid=float(row.get('Amount Paid', 0) or 0),
-                    payment_time=payment_time,
-                    payment_method=str(row.get('Payment Method', 'Unknown')),
-                    organization=organization,
-                    parking_duration_minutes=int(parking_duration),
-                    parking_status='completed' if exit_time else 'active'
-                )
-                
-                records_created += 1
-                
-                if records_created % 1000 == 0:
-                    self.stdout.write(f'Created {records_created} records...')
-                    
-            except Exception as e:
-                self.stdout.write(f'Error processing row {index}: {e}')
-                continue
-        
+        total_rows = 0
+        for file in excel_files:
+            self.stdout.write(f'Processing: {os.path.basename(file)}')
+            created, skipped, rows = ingest_file(file, log=self.stdout.write)
+            records_created += created
+            skipped_records += skipped
+            total_rows += rows
+            self.stdout.write(f'Created {records_created} records...')
+
         self.stdout.write(
             self.style.SUCCESS(
                 f'Data loading complete!\n'
-                f'Organizations: {len(organizations)}\n'
                 f'Parking Records: {records_created}\n'
                 f'Skipped Records: {skipped_records}\n'
-                f'Total rows processed: {len(master_df)}'
+                f'Total rows processed: {total_rows}'
             )
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from main_app.models import ParkingRecord, OrganizationAnalyticsRollup, OrganizationPlateVisits
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-organization analytics rollups from parking records'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Refreshing organization analytics rollups...')
+        
+        organizations = ParkingRecord.objects.order_by().values_list('organization', flat=True).distinct()
+        refreshed_count = 0
+        
+        for organization in organizations:
+            OrganizationAnalyticsRollup.refresh(organization)
+            refreshed_count += 1
+        
+        # Drop rollups for organizations that no longer have records
+        OrganizationAnalyticsRollup.objects.exclude(organization__in=list(organizations)).delete()
+        OrganizationPlateVisits.objects.exclude(organization__in=list(organizations)).delete()
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Refreshed rollups for {refreshed_count} organizations')
+        )
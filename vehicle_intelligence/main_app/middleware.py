@@ -1,6 +1,7 @@
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.urls import resolve
+from django.utils import timezone
 from django.utils.deprecation import MiddlewareMixin
 
 class RoleBasedAccessMiddleware(MiddlewareMixin):
@@ -199,4 +200,11 @@ class RoleBasedAccessMiddleware(MiddlewareMixin):
             storage = messages.get_messages(request)
             storage.used = True
         
-        return response
\ No newline at end of file
+        return response
+
+
+class RequestClockMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        """Sample the timezone-aware clock once so every consumer of this request shares it"""
+        request._now = timezone.now()
+        return None
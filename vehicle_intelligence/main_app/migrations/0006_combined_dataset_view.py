@@ -0,0 +1,42 @@
+# Generated migration to expose combined_dataset through a snake_case view
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0005_rename_parking_rec_plate_n_71d6b6_idx_combined_da_plate_n_ece7a2_idx_and_more'),
+    ]
+
+    operations = [
+        # Lowercase view over the Excel-imported columns so raw queries don't
+        # need quoted mixed-case identifiers, plus an index for the
+        # per-organization lookups
+        migrations.RunSQL(
+            """
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns 
+                    WHERE table_name = 'combined_dataset' 
+                    AND column_name = 'Plate Number'
+                ) THEN
+                    CREATE OR REPLACE VIEW combined_dataset_v AS
+                    SELECT "Organization" AS organization,
+                           "Plate Number" AS plate_number,
+                           "Amount Paid" AS amount_paid,
+                           "Duration (Minutes)" AS duration_minutes
+                    FROM combined_dataset;
+
+                    CREATE INDEX IF NOT EXISTS combined_dataset_org_name_idx
+                    ON combined_dataset ("Organization");
+                END IF;
+            END $$;
+            """,
+            reverse_sql="""
+            DROP VIEW IF EXISTS combined_dataset_v;
+            DROP INDEX IF EXISTS combined_dataset_org_name_idx;
+            """
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0006_combined_dataset_view'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parkingrecord',
+            index=models.Index(fields=['organization', 'plate_number', 'entry_time'], name='combined_org_plate_entry_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rollups(apps, schema_editor):
+    """Seed one rollup row per organization from the existing parking records"""
+    ParkingRecord = apps.get_model('main_app', 'ParkingRecord')
+    OrganizationAnalyticsRollup = apps.get_model('main_app', 'OrganizationAnalyticsRollup')
+    
+    rows = ParkingRecord.objects.order_by().values('organization').annotate(
+        vehicle_count=Count('plate_number', distinct=True),
+        total_revenue=Sum('amount_paid'),
+        total_duration_minutes=Sum('duration_minutes'),
+        duration_count=Count('duration_minutes'),
+        record_count=Count('id')
+    )
+    rollups = []
+    for row in rows:
+        organization = row.pop('organization')
+        rollups.append(OrganizationAnalyticsRollup(
+            organization=organization,
+            **{field: value or 0 for field, value in row.items()}
+        ))
+    OrganizationAnalyticsRollup.objects.bulk_create(rollups)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0007_parkingrecord_combined_org_plate_entry_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationAnalyticsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('organization', models.CharField(max_length=100, unique=True)),
+                ('vehicle_count', models.IntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_duration_minutes', models.BigIntegerField(default=0)),
+                ('duration_count', models.IntegerField(default=0)),
+                ('record_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'organization_analytics_rollups',
+                'ordering': ['-total_revenue'],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
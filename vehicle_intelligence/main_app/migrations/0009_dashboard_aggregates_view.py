@@ -0,0 +1,103 @@
+# Generated migration for the VehicleAnalytics dashboard aggregates
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0008_organizationanalyticsrollup'),
+    ]
+
+    operations = [
+        # Covering index for the filtered dashboard scans, and a materialized
+        # view holding every dashboard aggregate for all organizations ('*')
+        # and for each organization on its own. Refreshed by the
+        # refresh_dashboard_aggregates management command.
+        migrations.RunSQL(
+            """
+            DO $$
+            DECLARE
+                include_columns text := '"Amount Paid", "Plate Number"';
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'combined_dataset'
+                    AND column_name = 'Plate Number'
+                ) THEN
+                    -- entry_hour and the stay duration column only exist on
+                    -- some dataset layouts, so cover whichever are present
+                    SELECT include_columns || string_agg(', ' || quote_ident(column_name), '' ORDER BY column_name)
+                    INTO include_columns
+                    FROM information_schema.columns
+                    WHERE table_name = 'combined_dataset'
+                    AND column_name IN ('entry_hour', 'duration_minutes', 'parking_duration_minutes');
+
+                    EXECUTE format(
+                        'CREATE INDEX IF NOT EXISTS idx_cd_org_brand_type '
+                        'ON combined_dataset ("Organization", "Vehicle Brand", "Vehicle Type") INCLUDE (%s)',
+                        COALESCE(include_columns, '"Amount Paid", "Plate Number"')
+                    );
+
+                    -- Read through to_jsonb so a missing column is NULL, not an error
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_dashboard_agg AS
+                    WITH f AS (
+                        SELECT "Organization" AS org, "Plate Number" AS plate, "Vehicle Type" AS vehicle_type,
+                               "Amount Paid" AS amount,
+                               (to_jsonb(c) ->> 'entry_hour')::integer AS entry_hour,
+                               CASE WHEN to_jsonb(c) ? 'duration_minutes'
+                                    THEN (to_jsonb(c) ->> 'duration_minutes')::numeric
+                                    ELSE (to_jsonb(c) ->> 'parking_duration_minutes')::numeric END AS duration_minutes
+                        FROM combined_dataset c
+                    ),
+                    s AS (
+                        SELECT '*' AS scope, f.* FROM f
+                        UNION ALL
+                        SELECT org AS scope, f.* FROM f WHERE org IS NOT NULL
+                    ),
+                    org_amount AS (
+                        SELECT scope, org, AVG(amount) AS avg_amount, COUNT(*) AS visits,
+                               ROW_NUMBER() OVER (PARTITION BY scope ORDER BY AVG(amount) DESC) AS rank
+                        FROM s GROUP BY scope, org
+                    )
+                    SELECT scope, 'fleet' AS kind, ''::text AS label,
+                           COUNT(DISTINCT plate)::numeric AS v1, COUNT(*)::numeric AS v2, AVG(amount) AS v3
+                    FROM s GROUP BY scope
+                    UNION ALL
+                    SELECT scope, 'org_amount', COALESCE(org, ''), avg_amount, visits, NULL
+                    FROM org_amount WHERE rank <= 10
+                    UNION ALL
+                    SELECT scope, 'hourly', entry_hour::text, COUNT(*), NULL, NULL FROM s
+                    WHERE entry_hour IS NOT NULL GROUP BY scope, entry_hour
+                    UNION ALL
+                    SELECT scope, 'org_vehicles', COALESCE(org, ''), COUNT(DISTINCT plate), NULL, NULL
+                    FROM s GROUP BY scope, org
+                    UNION ALL
+                    SELECT scope, 'org_revenue', COALESCE(org, ''), SUM(amount), NULL, NULL FROM s
+                    WHERE amount > 0 GROUP BY scope, org
+                    UNION ALL
+                    SELECT scope, 'visits', bucket, COUNT(*), NULL, NULL FROM (
+                        SELECT scope,
+                               CASE WHEN COUNT(*) = 1 THEN '1'
+                                    WHEN COUNT(*) <= 3 THEN '2-3'
+                                    WHEN COUNT(*) <= 5 THEN '4-5'
+                                    WHEN COUNT(*) <= 10 THEN '6-10'
+                                    ELSE '10+' END AS bucket
+                        FROM s GROUP BY scope, plate
+                    ) v GROUP BY scope, bucket
+                    UNION ALL
+                    SELECT scope, 'type_duration', COALESCE(vehicle_type, ''), AVG(COALESCE(duration_minutes, 0)), COUNT(*), NULL
+                    FROM s WHERE amount > 0 GROUP BY scope, vehicle_type;
+
+                    -- Required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+                    CREATE UNIQUE INDEX IF NOT EXISTS mv_dashboard_agg_key
+                    ON mv_dashboard_agg (scope, kind, label);
+                END IF;
+            END $$;
+            """,
+            reverse_sql="""
+            DROP MATERIALIZED VIEW IF EXISTS mv_dashboard_agg;
+            DROP INDEX IF EXISTS idx_cd_org_brand_type;
+            """
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated migration for incrementally maintained dashboard histograms
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0009_dashboard_aggregates_view'),
+    ]
+
+    operations = [
+        # Hourly entry counts and per-plate visit counts for every
+        # (organization, brand, vehicle type), kept current by a row trigger
+        # on combined_dataset so the filtered histograms never rescan it.
+        # Missing keys are stored as '' so they can take part in the
+        # ON CONFLICT targets. entry_hour only exists on some dataset layouts,
+        # so it is read through to_jsonb.
+        migrations.RunSQL(
+            """
+            DO $do$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'combined_dataset'
+                    AND column_name = 'Plate Number'
+                ) THEN
+                    CREATE TABLE IF NOT EXISTS dashboard_hourly (
+                        org text NOT NULL,
+                        brand text NOT NULL,
+                        vehicle_type text NOT NULL,
+                        hour integer NOT NULL,
+                        entries bigint NOT NULL,
+                        PRIMARY KEY (org, brand, vehicle_type, hour)
+                    );
+
+                    CREATE TABLE IF NOT EXISTS dashboard_plate_visits (
+                        org text NOT NULL,
+                        brand text NOT NULL,
+                        vehicle_type text NOT NULL,
+                        plate text NOT NULL,
+                        visits bigint NOT NULL,
+                        PRIMARY KEY (org, brand, vehicle_type, plate)
+                    );
+
+                    INSERT INTO dashboard_hourly
+                    SELECT COALESCE("Organization", ''), COALESCE("Vehicle Brand", ''),
+                           COALESCE("Vehicle Type", ''), (to_jsonb(c) ->> 'entry_hour')::integer, COUNT(*)
+                    FROM combined_dataset c
+                    WHERE to_jsonb(c) ->> 'entry_hour' IS NOT NULL
+                    GROUP BY 1, 2, 3, 4
+                    ON CONFLICT DO NOTHING;
+
+                    INSERT INTO dashboard_plate_visits
+                    SELECT COALESCE("Organization", ''), COALESCE("Vehicle Brand", ''),
+                           COALESCE("Vehicle Type", ''), COALESCE("Plate Number", ''), COUNT(*)
+                    FROM combined_dataset
+                    GROUP BY 1, 2, 3, 4
+                    ON CONFLICT DO NOTHING;
+
+                    CREATE OR REPLACE FUNCTION dashboard_counters_apply(r combined_dataset, delta integer)
+                    RETURNS void AS $fn$
+                    DECLARE
+                        hour integer := (to_jsonb(r) ->> 'entry_hour')::integer;
+                    BEGIN
+                        IF hour IS NOT NULL THEN
+                            INSERT INTO dashboard_hourly AS h
+                            VALUES (COALESCE(r."Organization", ''), COALESCE(r."Vehicle Brand", ''),
+                                    COALESCE(r."Vehicle Type", ''), hour, delta)
+                            ON CONFLICT (org, brand, vehicle_type, hour)
+                            DO UPDATE SET entries = h.entries + EXCLUDED.entries;
+                        END IF;
+
+                        INSERT INTO dashboard_plate_visits AS p
+                        VALUES (COALESCE(r."Organization", ''), COALESCE(r."Vehicle Brand", ''),
+                                COALESCE(r."Vehicle Type", ''), COALESCE(r."Plate Number", ''), delta)
+                        ON CONFLICT (org, brand, vehicle_type, plate)
+                        DO UPDATE SET visits = p.visits + EXCLUDED.visits;
+                    END;
+                    $fn$ LANGUAGE plpgsql;
+
+                    CREATE OR REPLACE FUNCTION dashboard_counters_trigger()
+                    RETURNS trigger AS $fn$
+                    BEGIN
+                        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                            PERFORM dashboard_counters_apply(OLD, -1);
+                        END IF;
+                        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                            PERFORM dashboard_counters_apply(NEW, 1);
+                        END IF;
+                        RETURN NULL;
+                    END;
+                    $fn$ LANGUAGE plpgsql;
+
+                    DROP TRIGGER IF EXISTS combined_dataset_dashboard_counters ON combined_dataset;
+                    CREATE TRIGGER combined_dataset_dashboard_counters
+                    AFTER INSERT OR UPDATE OR DELETE ON combined_dataset
+                    FOR EACH ROW EXECUTE FUNCTION dashboard_counters_trigger();
+                END IF;
+            END $do$;
+            """,
+            reverse_sql="""
+            DROP TRIGGER IF EXISTS combined_dataset_dashboard_counters ON combined_dataset;
+            DROP FUNCTION IF EXISTS dashboard_counters_trigger();
+            DROP FUNCTION IF EXISTS dashboard_counters_apply(combined_dataset, integer);
+            DROP TABLE IF EXISTS dashboard_hourly;
+            DROP TABLE IF EXISTS dashboard_plate_visits;
+            """
+        ),
+    ]
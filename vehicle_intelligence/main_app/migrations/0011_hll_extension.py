@@ -0,0 +1,26 @@
+# Generated migration enabling approximate distinct counts for dashboards
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0010_dashboard_counters'),
+    ]
+
+    operations = [
+        # postgresql-hll is optional; without it the dashboards keep using
+        # exact COUNT(DISTINCT) (see analytics._hll_available)
+        migrations.RunSQL(
+            """
+            DO $$
+            BEGIN
+                CREATE EXTENSION IF NOT EXISTS hll;
+            EXCEPTION WHEN OTHERS THEN
+                RAISE NOTICE 'hll extension unavailable, using exact distinct counts';
+            END $$;
+            """,
+            reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
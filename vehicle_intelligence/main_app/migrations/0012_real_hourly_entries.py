@@ -0,0 +1,34 @@
+# Generated migration for the precomputed hourly entries summary
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0011_hll_extension'),
+    ]
+
+    operations = [
+        # Hourly entry counts per organization over real_movement_analytics.
+        # That table is only rewritten by generate_analytics_features, which
+        # rebuilds this summary alongside it; this seeds existing databases.
+        migrations.RunSQL(
+            """
+            DO $$
+            BEGIN
+                IF to_regclass('real_movement_analytics') IS NOT NULL THEN
+                    CREATE TABLE IF NOT EXISTS real_hourly_entries AS
+                    SELECT organization, hour_of_day, COUNT(*) AS entries
+                    FROM real_movement_analytics
+                    WHERE hour_of_day IS NOT NULL
+                    GROUP BY organization, hour_of_day;
+
+                    CREATE INDEX IF NOT EXISTS idx_real_hourly_entries_org
+                    ON real_hourly_entries (organization);
+                END IF;
+            END $$;
+            """,
+            reverse_sql="DROP TABLE IF EXISTS real_hourly_entries;"
+        ),
+    ]
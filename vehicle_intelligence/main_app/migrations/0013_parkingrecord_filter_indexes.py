@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0012_real_hourly_entries'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parkingrecord',
+            index=models.Index(fields=['organization', 'vehicle_type', 'entry_time'], name='combined_org_type_entry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingrecord',
+            index=models.Index(fields=['organization', 'vehicle_brand'], name='combined_org_brand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingrecord',
+            index=models.Index(condition=models.Q(('parking_status', 'active')), fields=['plate_number'], name='combined_active_plate_idx'),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated migration for the pre-aggregated dashboard amount totals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0013_parkingrecord_filter_indexes'),
+    ]
+
+    operations = [
+        # Record, amount and paid-stay totals for every (organization, brand,
+        # vehicle type), kept current by a row trigger on combined_dataset
+        # alongside the 0010 counters, so brand/type filtered dashboards read
+        # these totals instead of scanning combined_dataset. The stay duration
+        # column differs between datasets, so it is read through to_jsonb.
+        migrations.RunSQL(
+            """
+            DO $do$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_name = 'combined_dataset'
+                    AND column_name = 'Plate Number'
+                ) THEN
+                    CREATE TABLE IF NOT EXISTS dashboard_amounts (
+                        org text NOT NULL,
+                        brand text NOT NULL,
+                        vehicle_type text NOT NULL,
+                        records bigint NOT NULL,
+                        amount_sum numeric NOT NULL,
+                        amount_count bigint NOT NULL,
+                        paid_count bigint NOT NULL,
+                        paid_amount_sum numeric NOT NULL,
+                        paid_duration_sum numeric NOT NULL,
+                        PRIMARY KEY (org, brand, vehicle_type)
+                    );
+
+                    CREATE OR REPLACE FUNCTION dashboard_stay_minutes(r combined_dataset)
+                    RETURNS numeric AS $fn$
+                        SELECT CASE WHEN to_jsonb(r) ? 'duration_minutes'
+                                    THEN (to_jsonb(r) ->> 'duration_minutes')::numeric
+                                    ELSE (to_jsonb(r) ->> 'parking_duration_minutes')::numeric END;
+                    $fn$ LANGUAGE sql STABLE;
+
+                    INSERT INTO dashboard_amounts
+                    SELECT COALESCE(c."Organization", ''), COALESCE(c."Vehicle Brand", ''),
+                           COALESCE(c."Vehicle Type", ''), COUNT(*),
+                           COALESCE(SUM(c."Amount Paid"), 0), COUNT(c."Amount Paid"),
+                           COUNT(*) FILTER (WHERE c."Amount Paid" > 0),
+                           COALESCE(SUM(c."Amount Paid") FILTER (WHERE c."Amount Paid" > 0), 0),
+                           COALESCE(SUM(COALESCE(dashboard_stay_minutes(c), 0)) FILTER (WHERE c."Amount Paid" > 0), 0)
+                    FROM combined_dataset c
+                    GROUP BY 1, 2, 3
+                    ON CONFLICT DO NOTHING;
+
+                    CREATE OR REPLACE FUNCTION dashboard_amounts_apply(r combined_dataset, delta integer)
+                    RETURNS void AS $fn$
+                    DECLARE
+                        paid integer := CASE WHEN r."Amount Paid" > 0 THEN delta ELSE 0 END;
+                    BEGIN
+                        INSERT INTO dashboard_amounts AS a
+                        VALUES (COALESCE(r."Organization", ''), COALESCE(r."Vehicle Brand", ''),
+                                COALESCE(r."Vehicle Type", ''), delta,
+                                delta * COALESCE(r."Amount Paid", 0),
+                                CASE WHEN r."Amount Paid" IS NOT NULL THEN delta ELSE 0 END,
+                                paid, paid * COALESCE(r."Amount Paid", 0),
+                                paid * COALESCE(dashboard_stay_minutes(r), 0))
+                        ON CONFLICT (org, brand, vehicle_type)
+                        DO UPDATE SET records = a.records + EXCLUDED.records,
+                                      amount_sum = a.amount_sum + EXCLUDED.amount_sum,
+                                      amount_count = a.amount_count + EXCLUDED.amount_count,
+                                      paid_count = a.paid_count + EXCLUDED.paid_count,
+                                      paid_amount_sum = a.paid_amount_sum + EXCLUDED.paid_amount_sum,
+                                      paid_duration_sum = a.paid_duration_sum + EXCLUDED.paid_duration_sum;
+                    END;
+                    $fn$ LANGUAGE plpgsql;
+
+                    CREATE OR REPLACE FUNCTION dashboard_amounts_trigger()
+                    RETURNS trigger AS $fn$
+                    BEGIN
+                        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                            PERFORM dashboard_amounts_apply(OLD, -1);
+                        END IF;
+                        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                            PERFORM dashboard_amounts_apply(NEW, 1);
+                        END IF;
+                        RETURN NULL;
+                    END;
+                    $fn$ LANGUAGE plpgsql;
+
+                    DROP TRIGGER IF EXISTS combined_dataset_dashboard_amounts ON combined_dataset;
+                    CREATE TRIGGER combined_dataset_dashboard_amounts
+                    AFTER INSERT OR UPDATE OR DELETE ON combined_dataset
+                    FOR EACH ROW EXECUTE FUNCTION dashboard_amounts_trigger();
+                END IF;
+            END $do$;
+            """,
+            reverse_sql="""
+            DROP TRIGGER IF EXISTS combined_dataset_dashboard_amounts ON combined_dataset;
+            DROP FUNCTION IF EXISTS dashboard_amounts_trigger();
+            DROP FUNCTION IF EXISTS dashboard_amounts_apply(combined_dataset, integer);
+            DROP FUNCTION IF EXISTS dashboard_stay_minutes(combined_dataset);
+            DROP TABLE IF EXISTS dashboard_amounts;
+            """
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0014_dashboard_amounts'),
+    ]
+
+    operations = [
+        # Distinct vehicles are counted at read time from the
+        # (organization, plate_number, entry_time) index instead
+        migrations.RemoveField(
+            model_name='organizationanalyticsrollup',
+            name='vehicle_count',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated migration retiring the dashboard aggregates materialized view
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0015_remove_organizationanalyticsrollup_vehicle_count'),
+    ]
+
+    operations = [
+        # Dashboards read the trigger-maintained counter tables (0010, 0014),
+        # which are always current, so the snapshot view and the covering
+        # index for the old filtered scans are no longer used
+        migrations.RunSQL(
+            """
+            DROP MATERIALIZED VIEW IF EXISTS mv_dashboard_agg;
+            DROP INDEX IF EXISTS idx_cd_org_brand_type;
+            """,
+            reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_plate_visits(apps, schema_editor):
+    """Seed per-plate visit counts and each organization's vehicle count from the parking records"""
+    ParkingRecord = apps.get_model('main_app', 'ParkingRecord')
+    OrganizationAnalyticsRollup = apps.get_model('main_app', 'OrganizationAnalyticsRollup')
+    OrganizationPlateVisits = apps.get_model('main_app', 'OrganizationPlateVisits')
+    
+    rows = ParkingRecord.objects.order_by().values('organization', 'plate_number').annotate(visits=Count('id'))
+    OrganizationPlateVisits.objects.bulk_create(
+        (OrganizationPlateVisits(**row) for row in rows.iterator()),
+        batch_size=1000
+    )
+    
+    vehicle_counts = OrganizationPlateVisits.objects.values('organization').annotate(vehicle_count=Count('id'))
+    for row in vehicle_counts:
+        OrganizationAnalyticsRollup.objects.filter(organization=row['organization']).update(
+            vehicle_count=row['vehicle_count']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0016_drop_dashboard_aggregates_view'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationanalyticsrollup',
+            name='vehicle_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='OrganizationPlateVisits',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('organization', models.CharField(max_length=100)),
+                ('plate_number', models.CharField(max_length=20)),
+                ('visits', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'organization_plate_visits',
+                'unique_together': {('organization', 'plate_number')},
+            },
+        ),
+        migrations.RunPython(backfill_plate_visits, migrations.RunPython.noop),
+    ]
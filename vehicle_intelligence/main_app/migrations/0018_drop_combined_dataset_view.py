@@ -0,0 +1,19 @@
+# Generated migration to drop the unused snake_case combined_dataset view
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0017_organization_plate_visits'),
+    ]
+
+    operations = [
+        # Organization fleet stats are read through the ParkingRecord model,
+        # which works on every schema, so nothing reads the view any more
+        migrations.RunSQL(
+            "DROP VIEW IF EXISTS combined_dataset_v;",
+            reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
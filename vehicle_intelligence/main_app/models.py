@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connection, models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils import timezone
 import secrets
@@ -722,6 +722,11 @@ class ParkingRecord(models.Model):
         indexes = [
             models.Index(fields=['plate_number', 'entry_time']),
             models.Index(fields=['organization', 'entry_time']),
+            models.Index(fields=['organization', 'plate_number', 'entry_time'], name='combined_org_plate_entry_idx'),
+            models.Index(fields=['organization', 'vehicle_type', 'entry_time'], name='combined_org_type_entry_idx'),
+            models.Index(fields=['organization', 'vehicle_brand'], name='combined_org_brand_idx'),
+            # Open sessions looked up by plate when a vehicle exits
+            models.Index(fields=['plate_number'], condition=models.Q(parking_status='active'), name='combined_active_plate_idx'),
             models.Index(fields=['is_weekend', 'entry_time']),
             models.Index(fields=['is_peak_hours', 'entry_time']),
             models.Index(fields=['vehicle_usage_type']),
@@ -733,6 +738,139 @@ class ParkingRecord(models.Model):
         return f"{self.plate_number} - {self.organization} ({self.entry_time})"
 
 
+
+class OrganizationAnalyticsRollup(models.Model):
+    """Per-organization ParkingRecord totals, kept current on write for fast analytics reads"""
+    organization = models.CharField(max_length=100, unique=True)
+    vehicle_count = models.IntegerField(default=0)  # plates with at least one record
+    total_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_duration_minutes = models.BigIntegerField(default=0)
+    duration_count = models.IntegerField(default=0)  # records with a duration, for the average
+    record_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'organization_analytics_rollups'
+        ordering = ['-total_revenue']
+    
+    def __str__(self):
+        return f"{self.organization} rollup ({self.record_count} records)"
+    
+    @property
+    def avg_duration(self):
+        return self.total_duration_minutes / self.duration_count if self.duration_count else 0
+    
+    @staticmethod
+    def contribution(record):
+        """(organization, plate, revenue, duration minutes, duration count) a record adds to the totals"""
+        return (
+            record.organization,
+            record.plate_number,
+            record.amount_paid or 0,
+            record.duration_minutes or 0,
+            0 if record.duration_minutes is None else 1
+        )
+    
+    @classmethod
+    def apply_delta(cls, organization, plate_number, record_count, revenue, duration_minutes, duration_count):
+        """Add to an organization's totals and its plate's visit count in one statement.
+        
+        The plate row's upsert serializes concurrent writers for the same plate, so a
+        vehicle is counted exactly when its visits move between zero and non-zero.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                WITH plate AS (
+                    INSERT INTO {OrganizationPlateVisits._meta.db_table} AS v (organization, plate_number, visits)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (organization, plate_number) DO UPDATE SET visits = v.visits + EXCLUDED.visits
+                    RETURNING visits
+                )
+                INSERT INTO {cls._meta.db_table} AS r
+                    (organization, vehicle_count, total_revenue, total_duration_minutes,
+                     duration_count, record_count, updated_at)
+                SELECT %s, (visits > 0)::int - (visits - %s > 0)::int, %s, %s, %s, %s, %s FROM plate
+                ON CONFLICT (organization) DO UPDATE SET
+                    vehicle_count = r.vehicle_count + EXCLUDED.vehicle_count,
+                    total_revenue = r.total_revenue + EXCLUDED.total_revenue,
+                    total_duration_minutes = r.total_duration_minutes + EXCLUDED.total_duration_minutes,
+                    duration_count = r.duration_count + EXCLUDED.duration_count,
+                    record_count = r.record_count + EXCLUDED.record_count,
+                    updated_at = EXCLUDED.updated_at
+            """, [
+                organization, plate_number, record_count,
+                organization, record_count, revenue, duration_minutes, duration_count, record_count, timezone.now()
+            ])
+    
+    @classmethod
+    def record_created(cls, record):
+        """Fold a newly created parking record into its organization's totals"""
+        organization, plate_number, *values = cls.contribution(record)
+        cls.apply_delta(organization, plate_number, 1, *values)
+    
+    @classmethod
+    def record_updated(cls, record, previous):
+        """Move a saved record's totals from its previous contribution to its current one"""
+        new = cls.contribution(record)
+        if previous is None:
+            # The row was not in the database before this save
+            cls.record_created(record)
+        elif previous != new:
+            old_organization, old_plate, *old_values = previous
+            new_organization, new_plate, *new_values = new
+            if (old_organization, old_plate) == (new_organization, new_plate):
+                cls.apply_delta(new_organization, new_plate, 0, *(n - o for n, o in zip(new_values, old_values)))
+            else:
+                cls.apply_delta(old_organization, old_plate, -1, *(-value for value in old_values))
+                cls.apply_delta(new_organization, new_plate, 1, *new_values)
+    
+    @classmethod
+    def record_deleted(cls, record):
+        """Take a deleted parking record out of its organization's totals"""
+        organization, plate_number, *values = cls.contribution(record)
+        cls.apply_delta(organization, plate_number, -1, *(-value for value in values))
+    
+    @classmethod
+    def refresh(cls, organization):
+        """Recompute an organization's totals and plate visits from its parking records"""
+        records = ParkingRecord.objects.filter(organization=organization).order_by()
+        totals = records.aggregate(
+            vehicle_count=models.Count('plate_number', distinct=True),
+            total_revenue=models.Sum('amount_paid'),
+            total_duration_minutes=models.Sum('duration_minutes'),
+            duration_count=models.Count('duration_minutes'),
+            record_count=models.Count('id')
+        )
+        
+        OrganizationPlateVisits.objects.filter(organization=organization).delete()
+        if not totals['record_count']:
+            cls.objects.filter(organization=organization).delete()
+            return
+        
+        OrganizationPlateVisits.objects.bulk_create([
+            OrganizationPlateVisits(organization=organization, plate_number=plate_number, visits=visits)
+            for plate_number, visits in records.values_list('plate_number').annotate(visits=models.Count('id'))
+        ], batch_size=1000)
+        cls.objects.update_or_create(
+            organization=organization,
+            defaults={field: value or 0 for field, value in totals.items()}
+        )
+
+
+class OrganizationPlateVisits(models.Model):
+    """Records per (organization, plate), so rollup vehicle counts change only on a plate's first or last visit"""
+    organization = models.CharField(max_length=100)
+    plate_number = models.CharField(max_length=20)
+    visits = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'organization_plate_visits'
+        unique_together = ['organization', 'plate_number']
+    
+    def __str__(self):
+        return f"{self.plate_number} at {self.organization} ({self.visits} visits)"
+
+
 class VehicleMovement(models.Model):
     """Vehicle movement/trip data for analytics"""
     vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE, related_name='movements')
@@ -1,9 +1,34 @@
 from django.db import connection
 import json
 from datetime import datetime, timedelta
+from functools import lru_cache
 import plotly.graph_objects as go
 import plotly.express as px
-from plotly.utils import PlotlyJSONEncoder
+from .real_analytics import cached_chart, dumps_figure, report_chart_error
+
+# Returned whenever a chart is requested without an organization
+_NO_ORGANIZATION_CHART = json.dumps({'data': [], 'layout': {'title': 'No organization specified'}})
+
+# Payment method label, simulated from the amount when the column is missing
+_PAYMENT_METHOD_SQL = "COALESCE(payment_method, 'Cash')"
+_SIMULATED_PAYMENT_METHOD_SQL = """
+    CASE 
+        WHEN amount_paid <= 100 THEN 'Cash'
+        WHEN amount_paid <= 500 THEN 'Mobile Money'
+        ELSE 'Card Payment'
+    END"""
+
+
+@lru_cache(maxsize=1)
+def _has_payment_method():
+    """Whether real_movement_analytics has a payment_method column, looked up once per process"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns 
+            WHERE table_name = 'real_movement_analytics' AND column_name = 'payment_method'
+        """)
+        return cursor.fetchone() is not None
+
 
 class OrgAnalytics:
     """Organization-specific analytics for admin dashboard with Plotly visualizations"""
@@ -42,75 +67,39 @@ class OrgAnalytics:
         return " AND ".join(where_conditions), params
     
     @staticmethod
+    @cached_chart
     def get_filter_options(organization_name):
         """Get available filter options from the dataset for the organization"""
         try:
             with connection.cursor() as cursor:
-                filters = {}
-                
-                # Get months
-                cursor.execute("""
-                    SELECT DISTINCT EXTRACT(MONTH FROM entry_time) as month
-                    FROM real_movement_analytics 
-                    WHERE (organization = %s OR organization ILIKE %s)
-                    AND entry_time IS NOT NULL
-                    ORDER BY month
-                """, [organization_name, f'%{organization_name.split()[0]}%'])
-                filters['months'] = [{'value': int(row[0]), 'label': datetime(2024, int(row[0]), 1).strftime('%B')} for row in cursor.fetchall() if row[0]]
-                
-                # Get vehicle types
-                cursor.execute("""
-                    SELECT DISTINCT vehicle_type
-                    FROM real_movement_analytics 
-                    WHERE (organization = %s OR organization ILIKE %s)
-                    AND vehicle_type IS NOT NULL
-                    ORDER BY vehicle_type
-                """, [organization_name, f'%{organization_name.split()[0]}%'])
-                filters['vehicle_types'] = [row[0] for row in cursor.fetchall()]
-                
-                # Get vehicle brands
-                cursor.execute("""
-                    SELECT DISTINCT vehicle_brand
-                    FROM real_movement_analytics 
-                    WHERE (organization = %s OR organization ILIKE %s)
-                    AND vehicle_brand IS NOT NULL
-                    ORDER BY vehicle_brand
-                """, [organization_name, f'%{organization_name.split()[0]}%'])
-                filters['vehicle_brands'] = [row[0] for row in cursor.fetchall()]
-                
-                # Get payment methods
-                cursor.execute("""
-                    SELECT DISTINCT payment_method
-                    FROM real_movement_analytics 
-                    WHERE (organization = %s OR organization ILIKE %s)
-                    AND payment_method IS NOT NULL
-                    ORDER BY payment_method
-                """, [organization_name, f'%{organization_name.split()[0]}%'])
-                filters['payment_methods'] = [row[0] for row in cursor.fetchall()]
-                
-                # Get plate colors
+                # Every option list from one pass over the organization's rows
                 cursor.execute("""
-                    SELECT DISTINCT plate_color
+                    SELECT 
+                        array_agg(DISTINCT EXTRACT(MONTH FROM entry_time)::int
+                                  ORDER BY EXTRACT(MONTH FROM entry_time)::int) FILTER (WHERE entry_time IS NOT NULL),
+                        array_agg(DISTINCT vehicle_type ORDER BY vehicle_type) FILTER (WHERE vehicle_type IS NOT NULL),
+                        array_agg(DISTINCT vehicle_brand ORDER BY vehicle_brand) FILTER (WHERE vehicle_brand IS NOT NULL),
+                        array_agg(DISTINCT payment_method ORDER BY payment_method) FILTER (WHERE payment_method IS NOT NULL),
+                        array_agg(DISTINCT plate_color ORDER BY plate_color) FILTER (WHERE plate_color IS NOT NULL),
+                        array_agg(DISTINCT EXTRACT(YEAR FROM entry_time)::int
+                                  ORDER BY EXTRACT(YEAR FROM entry_time)::int DESC) FILTER (WHERE entry_time IS NOT NULL)
                     FROM real_movement_analytics 
                     WHERE (organization = %s OR organization ILIKE %s)
-                    AND plate_color IS NOT NULL
-                    ORDER BY plate_color
                 """, [organization_name, f'%{organization_name.split()[0]}%'])
-                filters['plate_colors'] = [row[0] for row in cursor.fetchall()]
+                months, vehicle_types, vehicle_brands, payment_methods, plate_colors, years = cursor.fetchone()
                 
-                # Get years
-                cursor.execute("""
-                    SELECT DISTINCT EXTRACT(YEAR FROM entry_time) as year
-                    FROM real_movement_analytics 
-                    WHERE (organization = %s OR organization ILIKE %s)
-                    AND entry_time IS NOT NULL
-                    ORDER BY year DESC
-                """, [organization_name, f'%{organization_name.split()[0]}%'])
-                filters['years'] = [int(row[0]) for row in cursor.fetchall() if row[0]]
+                filters = {
+                    'months': [{'value': month, 'label': datetime(2024, month, 1).strftime('%B')} for month in months or [] if month],
+                    'vehicle_types': vehicle_types or [],
+                    'vehicle_brands': vehicle_brands or [],
+                    'payment_methods': payment_methods or [],
+                    'plate_colors': plate_colors or [],
+                    'years': [year for year in years or [] if year]
+                }
                 
                 return filters
         except Exception as e:
-            print(f"Error getting filter options: {e}")
+            report_chart_error(f"Error getting filter options: {e}")
             return {
                 'months': [],
                 'vehicle_types': [],
@@ -121,6 +110,7 @@ class OrgAnalytics:
             }
     
     @staticmethod
+    @cached_chart
     def get_org_parking_duration_analysis(organization_name, filters=None):
         """Get parking duration analysis for specific organization using duration_minutes column"""
         try:
@@ -184,16 +174,17 @@ class OrgAnalytics:
                     margin=dict(l=40, r=40, t=60, b=40)
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_parking_duration_analysis: {e}")
+            report_chart_error(f"Error in get_org_parking_duration_analysis: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_org_hourly_entries_chart(organization_name, filters=None):
         """Get hourly vehicle entries for specific organization showing peak time analysis"""
         try:
@@ -248,16 +239,17 @@ class OrgAnalytics:
                     margin=dict(l=40, r=40, t=60, b=40)
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_hourly_entries_chart: {e}")
+            report_chart_error(f"Error in get_org_hourly_entries_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_org_vehicles_count_chart(organization_name, filters=None):
         """Get number of vehicles that visited this particular organization"""
         try:
@@ -326,16 +318,17 @@ class OrgAnalytics:
                     ]
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_vehicles_count_chart: {e}")
+            report_chart_error(f"Error in get_org_vehicles_count_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_org_revenue_analysis_chart(organization_name, filters=None):
         """Get revenue analysis showing total amount paid by all vehicles in this organization"""
         try:
@@ -390,16 +383,17 @@ class OrgAnalytics:
                     margin=dict(l=40, r=40, t=60, b=40)
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_revenue_analysis_chart: {e}")
+            report_chart_error(f"Error in get_org_revenue_analysis_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_org_avg_stay_by_type_chart(organization_name, filters=None):
         """Get average stay by vehicle type for specific organization comparing parking duration (exit_time - entry_time)"""
         try:
@@ -464,20 +458,21 @@ class OrgAnalytics:
                     margin=dict(l=40, r=40, t=60, b=60)
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_avg_stay_by_type_chart: {e}")
+            report_chart_error(f"Error in get_org_avg_stay_by_type_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_org_capacity_utilization_chart(organization_name, filters=None):
         """Get capacity utilization showing peak vs off-peak usage"""
         if not organization_name:
-            return json.dumps({'data': [], 'layout': {'title': 'No organization specified'}})
+            return _NO_ORGANIZATION_CHART
             
         try:
             with connection.cursor() as cursor:
@@ -528,20 +523,21 @@ class OrgAnalytics:
                     margin=dict(l=40, r=40, t=60, b=60)
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_capacity_utilization_chart: {e}")
+            report_chart_error(f"Error in get_org_capacity_utilization_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_org_customer_loyalty_chart(organization_name, filters=None):
         """Get customer loyalty analysis showing repeat vs new visitors"""
         if not organization_name:
-            return json.dumps({'data': [], 'layout': {'title': 'No organization specified'}})
+            return _NO_ORGANIZATION_CHART
             
         try:
             with connection.cursor() as cursor:
@@ -594,39 +590,53 @@ class OrgAnalytics:
                     margin=dict(l=40, r=40, t=60, b=40)
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_customer_loyalty_chart: {e}")
+            report_chart_error(f"Error in get_org_customer_loyalty_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_org_revenue_trends_chart(organization_name, filters=None):
         """Get revenue trends over the last 6 months with growth indicators"""
         if not organization_name:
-            return json.dumps({'data': [], 'layout': {'title': 'No organization specified'}})
+            return _NO_ORGANIZATION_CHART
             
         try:
             with connection.cursor() as cursor:
+                # Every week in the window, with zeros for weeks without visits
                 cursor.execute("""
                     SELECT 
-                        DATE_TRUNC('week', entry_time) as week,
-                        SUM(amount_paid) as weekly_revenue,
-                        COUNT(*) as weekly_visits,
-                        COUNT(DISTINCT plate_number) as unique_customers
-                    FROM real_movement_analytics 
-                    WHERE (organization = %s OR organization ILIKE %s)
-                    AND entry_time >= CURRENT_DATE - INTERVAL '12 weeks'
-                    AND amount_paid IS NOT NULL
-                    GROUP BY DATE_TRUNC('week', entry_time)
-                    ORDER BY week
+                        weeks.week,
+                        COALESCE(totals.weekly_revenue, 0) as weekly_revenue,
+                        COALESCE(totals.weekly_visits, 0) as weekly_visits,
+                        COALESCE(totals.unique_customers, 0) as unique_customers
+                    FROM generate_series(
+                        DATE_TRUNC('week', CURRENT_DATE - INTERVAL '12 weeks'),
+                        DATE_TRUNC('week', CURRENT_DATE),
+                        INTERVAL '1 week'
+                    ) AS weeks(week)
+                    LEFT JOIN (
+                        SELECT 
+                            DATE_TRUNC('week', entry_time) as week,
+                            SUM(amount_paid) as weekly_revenue,
+                            COUNT(*) as weekly_visits,
+                            COUNT(DISTINCT plate_number) as unique_customers
+                        FROM real_movement_analytics 
+                        WHERE (organization = %s OR organization ILIKE %s)
+                        AND entry_time >= CURRENT_DATE - INTERVAL '12 weeks'
+                        AND amount_paid IS NOT NULL
+                        GROUP BY DATE_TRUNC('week', entry_time)
+                    ) totals ON totals.week = weeks.week
+                    ORDER BY weeks.week
                 """, [organization_name, f'%{organization_name.split()[0]}%'])
                 
                 results = cursor.fetchall()
-                if not results:
+                if not any(row[2] for row in results):
                     return json.dumps({'data': [], 'layout': {'title': 'No revenue trend data available'}})
                 
                 weeks = [row[0].strftime('%b %d') for row in results]
@@ -658,61 +668,37 @@ class OrgAnalytics:
                     margin=dict(l=40, r=40, t=60, b=40)
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_revenue_trends_chart: {e}")
+            report_chart_error(f"Error in get_org_revenue_trends_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_org_payment_behavior_chart(organization_name, filters=None):
         """Get payment methods analysis showing comparison of payment methods with total amounts"""
         if not organization_name:
-            return json.dumps({'data': [], 'layout': {'title': 'No organization specified'}})
+            return _NO_ORGANIZATION_CHART
             
         try:
             with connection.cursor() as cursor:
-                # Check if payment_method column exists
-                cursor.execute("""
-                    SELECT column_name FROM information_schema.columns 
-                    WHERE table_name = 'real_movement_analytics' AND column_name = 'payment_method'
-                """)
-                has_payment_method = cursor.fetchone() is not None
-                
-                if has_payment_method:
-                    cursor.execute("""
-                        SELECT 
-                            COALESCE(payment_method, 'Cash') as method,
-                            COUNT(*) as transaction_count,
-                            SUM(amount_paid) as total_amount,
-                            AVG(amount_paid) as avg_amount
-                        FROM real_movement_analytics 
-                        WHERE (organization = %s OR organization ILIKE %s)
-                        AND amount_paid IS NOT NULL AND amount_paid > 0
-                        GROUP BY payment_method
-                        ORDER BY total_amount DESC
-                    """, [organization_name, f'%{organization_name.split()[0]}%'])
-                else:
-                    # Simulate payment methods based on amount ranges
-                    cursor.execute("""
-                        SELECT 
-                            CASE 
-                                WHEN amount_paid <= 100 THEN 'Cash'
-                                WHEN amount_paid <= 500 THEN 'Mobile Money'
-                                ELSE 'Card Payment'
-                            END as method,
-                            COUNT(*) as transaction_count,
-                            SUM(amount_paid) as total_amount,
-                            AVG(amount_paid) as avg_amount
-                        FROM real_movement_analytics 
-                        WHERE (organization = %s OR organization ILIKE %s)
-                        AND amount_paid IS NOT NULL AND amount_paid > 0
-                        GROUP BY method
-                        ORDER BY total_amount DESC
-                    """, [organization_name, f'%{organization_name.split()[0]}%'])
+                method = _PAYMENT_METHOD_SQL if _has_payment_method() else _SIMULATED_PAYMENT_METHOD_SQL
+                cursor.execute(f"""
+                    SELECT 
+                        {method} as method,
+                        COUNT(*) as transaction_count,
+                        SUM(amount_paid) as total_amount,
+                        AVG(amount_paid) as avg_amount
+                    FROM real_movement_analytics 
+                    WHERE (organization = %s OR organization ILIKE %s)
+                    AND amount_paid > 0
+                    GROUP BY 1
+                    ORDER BY total_amount DESC
+                """, [organization_name, f'%{organization_name.split()[0]}%'])
                 
                 results = cursor.fetchall()
                 if not results:
@@ -756,20 +742,21 @@ class OrgAnalytics:
                     margin=dict(l=40, r=120, t=60, b=40)
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_payment_behavior_chart: {e}")
+            report_chart_error(f"Error in get_org_payment_behavior_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_org_vehicle_brand_performance_chart(organization_name):
         """Get vehicle brand performance showing which brands generate most revenue"""
         if not organization_name:
-            return json.dumps({'data': [], 'layout': {'title': 'No organization specified'}})
+            return _NO_ORGANIZATION_CHART
             
         try:
             with connection.cursor() as cursor:
@@ -829,20 +816,21 @@ class OrgAnalytics:
                     margin=dict(l=40, r=40, t=60, b=40)
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_vehicle_brand_performance_chart: {e}")
+            report_chart_error(f"Error in get_org_vehicle_brand_performance_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_org_seasonal_patterns_chart(organization_name):
         """Get seasonal patterns showing monthly trends with heatmap"""
         if not organization_name:
-            return json.dumps({'data': [], 'layout': {'title': 'No organization specified'}})
+            return _NO_ORGANIZATION_CHART
             
         try:
             with connection.cursor() as cursor:
@@ -897,10 +885,10 @@ class OrgAnalytics:
                     margin=dict(l=40, r=40, t=60, b=40)
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_org_seasonal_patterns_chart: {e}")
+            report_chart_error(f"Error in get_org_seasonal_patterns_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
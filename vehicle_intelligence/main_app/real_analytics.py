@@ -1,14 +1,97 @@
-from django.db import connection
+from django.core.cache import cache
+from django.db import connection, connections
+from django.utils import timezone
 import json
+import contextvars
+import hashlib
+import orjson
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 from datetime import datetime, timedelta
 import plotly.graph_objects as go
 import plotly.express as px
-from plotly.utils import PlotlyJSONEncoder
+from .signals import REAL_ANALYTICS_VERSION_CACHE_KEY
+
+# Chart JSON only changes when real_movement_analytics is rebuilt, so it is
+# kept for an hour and keyed on the rebuild version and the current day
+CHART_CACHE_TIMEOUT = 3600
+
+
+def _orjson_default(obj):
+    """Serialize the Decimal aggregates Postgres returns"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+
+def dumps_figure(fig):
+    """Serialize a Plotly figure with orjson instead of the PlotlyJSONEncoder"""
+    return orjson.dumps(
+        fig.to_plotly_json(),
+        default=_orjson_default,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC,
+    ).decode()
+
+
+# Set by report_chart_error while a chart builds, so its fallback figure is not cached
+_chart_failed = contextvars.ContextVar('chart_failed', default=False)
+
+
+def report_chart_error(message):
+    """Log a chart builder failure and keep its fallback result out of the cache"""
+    print(message)
+    _chart_failed.set(True)
+
+
+def cached_chart(chart):
+    """Memoize a chart's (or summary's) successful result per (function, arguments, day, data version)"""
+    @wraps(chart)
+    def wrapper(*args, **kwargs):
+        version = cache.get(REAL_ANALYTICS_VERSION_CACHE_KEY, 0)
+        args_digest = hashlib.blake2b(repr((args, sorted(kwargs.items()))).encode(), digest_size=8).hexdigest()
+        key = f'vi:chart:{version}:{chart.__name__}:{args_digest}:{timezone.localdate()}'
+        result = cache.get(key)
+        if result is None:
+            token = _chart_failed.set(False)
+            try:
+                result = chart(*args, **kwargs)
+                failed = _chart_failed.get()
+            finally:
+                _chart_failed.reset(token)
+            if failed:
+                # A chart built from this one's error payload must not be cached either
+                _chart_failed.set(True)
+            else:
+                cache.set(key, result, CHART_CACHE_TIMEOUT)
+        return result
+    return wrapper
+
+
+# Each worker holds its own database connection for the request, so keep the
+# fan-out small enough that a few concurrent page loads cannot exhaust the pool
+CHART_WORKERS = 3
+
+
+def run_concurrently(calls, max_workers=CHART_WORKERS):
+    """Run independent chart builders on a thread pool, returning {name: result}"""
+    def run(builder):
+        try:
+            return builder()
+        finally:
+            # Each worker thread opened its own connection
+            connections.close_all()
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(run, builder) for name, builder in calls.items()}
+        return {name: future.result() for name, future in futures.items()}
+
 
 class RealAnalytics:
     """Enhanced analytics using real_movement_analytics data with Plotly visualizations"""
     
     @staticmethod
+    @cached_chart
     def get_parking_duration_analysis(organization=None):
         """Get parking duration analysis using pre-calculated duration_minutes"""
         try:
@@ -64,29 +147,30 @@ class RealAnalytics:
                     paper_bgcolor='rgba(0,0,0,0)'
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_parking_duration_analysis: {e}")
+            report_chart_error(f"Error in get_parking_duration_analysis: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_hourly_entries_chart(organization=None):
         """Get hourly vehicle entries showing peak time analysis"""
         try:
             with connection.cursor() as cursor:
-                where_clause = 'WHERE organization = %s' if organization else ""
+                where_clause = 'AND organization = %s' if organization else ""
                 params = [organization] if organization else []
                 
-                # Extract hour from entry_time and count entries
+                # Read the hourly counts precomputed by generate_analytics_features
                 cursor.execute(f"""
                     SELECT 
                         hour_of_day,
-                        COUNT(*) as entry_count
-                    FROM real_movement_analytics 
+                        SUM(entries) as entry_count
+                    FROM real_hourly_entries 
                     WHERE hour_of_day IS NOT NULL
                     {where_clause}
                     GROUP BY hour_of_day
@@ -128,16 +212,17 @@ class RealAnalytics:
                     paper_bgcolor='rgba(0,0,0,0)'
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_hourly_entries_chart: {e}")
+            report_chart_error(f"Error in get_hourly_entries_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_vehicles_per_organization_chart():
         """Get vehicles that visited each organization"""
         try:
@@ -180,16 +265,17 @@ class RealAnalytics:
                     paper_bgcolor='rgba(0,0,0,0)'
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_vehicles_per_organization_chart: {e}")
+            report_chart_error(f"Error in get_vehicles_per_organization_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_revenue_per_organization_chart():
         """Get revenue analysis showing total amount paid by all vehicles in each organization"""
         try:
@@ -245,16 +331,17 @@ class RealAnalytics:
                     paper_bgcolor='rgba(0,0,0,0)'
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_revenue_per_organization_chart: {e}")
+            report_chart_error(f"Error in get_revenue_per_organization_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_visit_patterns_chart(organization=None):
         """Get vehicle visit patterns by analyzing frequency and behavior"""
         try:
@@ -263,33 +350,24 @@ class RealAnalytics:
                 params = [organization] if organization else []
                 
                 # Analyze visit patterns by grouping vehicles by visit frequency
+                # width_bucket maps visit counts onto the 5/20/50 thresholds (0-3)
                 cursor.execute(f"""
                     WITH vehicle_visits AS (
-                        SELECT 
-                            plate_number,
-                            COUNT(*) as visit_count,
-                            CASE 
-                                WHEN COUNT(*) >= 50 THEN 'Frequent (50+ visits)'
-                                WHEN COUNT(*) >= 20 THEN 'Regular (20-49 visits)'
-                                WHEN COUNT(*) >= 5 THEN 'Occasional (5-19 visits)'
-                                ELSE 'Rare (1-4 visits)'
-                            END as visit_pattern
+                        SELECT COUNT(*) as visit_count
                         FROM real_movement_analytics 
                         {where_clause}
                         GROUP BY plate_number
                     )
                     SELECT 
-                        visit_pattern,
-                        COUNT(*) as vehicle_count
-                    FROM vehicle_visits
-                    GROUP BY visit_pattern
-                    ORDER BY 
-                        CASE visit_pattern
-                            WHEN 'Frequent (50+ visits)' THEN 1
-                            WHEN 'Regular (20-49 visits)' THEN 2
-                            WHEN 'Occasional (5-19 visits)' THEN 3
-                            ELSE 4
-                        END
+                        (ARRAY['Rare (1-4 visits)', 'Occasional (5-19 visits)',
+                               'Regular (20-49 visits)', 'Frequent (50+ visits)'])[bucket + 1] as visit_pattern,
+                        vehicle_count
+                    FROM (
+                        SELECT width_bucket(visit_count, ARRAY[5, 20, 50]) as bucket, COUNT(*) as vehicle_count
+                        FROM vehicle_visits
+                        GROUP BY bucket
+                    ) buckets
+                    ORDER BY bucket DESC
                 """, params)
                 
                 results = cursor.fetchall()
@@ -320,36 +398,40 @@ class RealAnalytics:
                     paper_bgcolor='rgba(0,0,0,0)'
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_visit_patterns_chart: {e}")
+            report_chart_error(f"Error in get_visit_patterns_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
             })
     
     @staticmethod
+    @cached_chart
     def get_avg_stay_by_type_chart(organization=None):
         """Get average stay by vehicle type comparing parking duration (exit_time - entry_time)"""
         try:
             with connection.cursor() as cursor:
-                where_clause = 'WHERE organization = %s' if organization else ""
+                where_clause = 'AND organization = %s' if organization else ""
                 params = [organization] if organization else []
                 
-                # Calculate average parking duration by vehicle type
+                # Calculate average parking duration by vehicle type, deriving
+                # each row's duration once instead of once per aggregate
                 cursor.execute(f"""
                     SELECT 
                         COALESCE(vehicle_type, 'Unknown') as vehicle_type,
-                        AVG(EXTRACT(EPOCH FROM (exit_time - entry_time))/60) as avg_duration_minutes,
+                        AVG(stay_minutes) as avg_duration_minutes,
                         COUNT(*) as visit_count,
-                        MIN(EXTRACT(EPOCH FROM (exit_time - entry_time))/60) as min_duration,
-                        MAX(EXTRACT(EPOCH FROM (exit_time - entry_time))/60) as max_duration
-                    FROM real_movement_analytics 
-                    WHERE exit_time IS NOT NULL AND entry_time IS NOT NULL
-                    AND EXTRACT(EPOCH FROM (exit_time - entry_time))/60 > 0
-                    AND EXTRACT(EPOCH FROM (exit_time - entry_time))/60 < 1440  -- Less than 24 hours
-                    {where_clause}
+                        MIN(stay_minutes) as min_duration,
+                        MAX(stay_minutes) as max_duration
+                    FROM (
+                        SELECT vehicle_type, EXTRACT(EPOCH FROM (exit_time - entry_time))/60 as stay_minutes
+                        FROM real_movement_analytics 
+                        WHERE exit_time IS NOT NULL AND entry_time IS NOT NULL
+                        {where_clause}
+                    ) stays
+                    WHERE stay_minutes > 0 AND stay_minutes < 1440  -- Less than 24 hours
                     GROUP BY vehicle_type
                     HAVING COUNT(*) >= 5  -- At least 5 visits for meaningful average
                     ORDER BY avg_duration_minutes DESC
@@ -395,10 +477,10 @@ class RealAnalytics:
                     xaxis={'tickangle': -45}
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
                 
         except Exception as e:
-            print(f"Error in get_avg_stay_by_type_chart: {e}")
+            report_chart_error(f"Error in get_avg_stay_by_type_chart: {e}")
             return json.dumps({
                 'data': [{'x': ['Error'], 'y': [0], 'type': 'bar'}],
                 'layout': {'title': f'Error loading data: {str(e)}'}
@@ -438,10 +520,11 @@ class RealAnalytics:
                     'total_fuel': 0     # Not available in parking data
                 } for org, freq, duration, cost, revenue in results]
         except Exception as e:
-            print(f"Error in get_route_analysis: {e}")
+            report_chart_error(f"Error in get_route_analysis: {e}")
             return []
     
     @staticmethod
+    @cached_chart
     def get_fleet_summary(organization=None, filters=None):
         """Get comprehensive fleet summary for specific organization"""
         try:
@@ -519,7 +602,7 @@ class RealAnalytics:
                     'recent_visits': 0
                 }
         except Exception as e:
-            print(f"Error in get_fleet_summary: {e}")
+            report_chart_error(f"Error in get_fleet_summary: {e}")
             return {
                 'total_vehicles': 0,
                 'total_visits': 0,
@@ -531,6 +614,7 @@ class RealAnalytics:
             }
     
     @staticmethod
+    @cached_chart
     def get_route_analysis(organization=None):
         """Get route analysis data"""
         with connection.cursor() as cursor:
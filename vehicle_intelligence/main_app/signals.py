@@ -1,11 +1,94 @@
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, pre_save, post_save, post_delete
 from django.dispatch import receiver
+from django.core.cache import cache
 from django.core.management import call_command
-from django.db import connection
+from django.db import connection, transaction
+from .models import Organization, CustomUser, ParkingRecord, OrganizationAnalyticsRollup
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Cached table counts shown on the super admin dashboard
+ORGANIZATION_COUNT_CACHE_KEY = 'organization_count'
+# Organization id -> name map used to resolve organization filters
+ORGANIZATION_NAMES_CACHE_KEY = 'organization_names'
+USER_COUNT_CACHE_KEY = 'user_count'
+# Per-organization total/active user counts shown on the org admin dashboard
+ORG_USER_COUNTS_CACHE_KEY = 'org_user_counts:{}'
+
+@receiver([post_save, post_delete], sender=Organization)
+def invalidate_organization_count(sender, **kwargs):
+    """Drop the cached organization count and names when organizations change"""
+    cache.delete_many([ORGANIZATION_COUNT_CACHE_KEY, ORGANIZATION_NAMES_CACHE_KEY])
+
+@receiver(pre_save, sender=CustomUser)
+def capture_previous_organization(sender, instance, raw, **kwargs):
+    """Remember a user's stored organization so moving them clears both organizations' counts"""
+    instance._previous_organization_id = None
+    if instance.pk and not raw:
+        instance._previous_organization_id = sender.objects.filter(pk=instance.pk).values_list(
+            'organization_id', flat=True
+        ).first()
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_user_count(sender, instance, **kwargs):
+    """Drop the cached user counts when users change"""
+    organization_ids = {instance.organization_id, getattr(instance, '_previous_organization_id', None)}
+    cache.delete_many([USER_COUNT_CACHE_KEY] + [
+        ORG_USER_COUNTS_CACHE_KEY.format(organization_id)
+        for organization_id in organization_ids if organization_id is not None
+    ])
+
+# Bumped on parking record writes; AI context and dashboard analytics cache
+# keys embed them so stale entries are never read
+AI_CONTEXT_VERSION_CACHE_KEY = 'ai_ctx_version'
+ANALYTICS_VERSION_CACHE_KEY = 'analytics_version'
+# Bumped when generate_analytics_features rebuilds real_movement_analytics
+REAL_ANALYTICS_VERSION_CACHE_KEY = 'real_analytics_version'
+
+def bump_cache_version(version_key):
+    """Move caches keyed on this version counter to a fresh key space"""
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.set(version_key, 1, None)
+
+def bump_parking_cache_versions():
+    """Invalidate the AI context and dashboard caches built from parking records"""
+    bump_cache_version(AI_CONTEXT_VERSION_CACHE_KEY)
+    bump_cache_version(ANALYTICS_VERSION_CACHE_KEY)
+
+@receiver([post_save, post_delete], sender=ParkingRecord)
+def invalidate_ai_context(sender, **kwargs):
+    """Invalidate cached AI context and dashboard analytics when vehicle data changes"""
+    # Bumping before commit would let a concurrent reader re-cache the old rows
+    # under the new version
+    transaction.on_commit(bump_parking_cache_versions)
+
+@receiver(pre_save, sender=ParkingRecord)
+def capture_rollup_contribution(sender, instance, raw, **kwargs):
+    """Read what an existing record contributes to the rollup before it is overwritten"""
+    instance._rollup_previous = None
+    if instance.pk and not raw:
+        previous = sender.objects.filter(pk=instance.pk).values(
+            'organization', 'plate_number', 'amount_paid', 'duration_minutes'
+        ).first()
+        if previous:
+            instance._rollup_previous = OrganizationAnalyticsRollup.contribution(sender(**previous))
+
+@receiver(post_save, sender=ParkingRecord)
+def update_analytics_rollup(sender, instance, created, **kwargs):
+    """Keep the organization rollup in step with parking record writes"""
+    if created:
+        OrganizationAnalyticsRollup.record_created(instance)
+    else:
+        OrganizationAnalyticsRollup.record_updated(instance, getattr(instance, '_rollup_previous', None))
+
+@receiver(post_delete, sender=ParkingRecord)
+def refresh_analytics_rollup(sender, instance, **kwargs):
+    """Take a deleted parking record out of the organization rollup"""
+    OrganizationAnalyticsRollup.record_deleted(instance)
+
 @receiver(post_migrate)
 def create_vehicle_users_on_startup(sender, **kwargs):
     """Automatically create users from vehicle data on server startup"""
@@ -1,7 +1,6 @@
-import json
 from django.db import connection
 import plotly.graph_objects as go
-from plotly.utils import PlotlyJSONEncoder
+from .real_analytics import dumps_figure
 
 class SimpleCharts:
     """Simple chart generation using combined_dataset table"""
@@ -48,7 +47,7 @@ class SimpleCharts:
                     height=300
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
         except Exception as e:
             print(f"Error in simple parking duration chart: {e}")
             return None
@@ -95,7 +94,7 @@ class SimpleCharts:
                     height=300
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
         except Exception as e:
             print(f"Error in simple hourly chart: {e}")
             return None
@@ -135,7 +134,7 @@ class SimpleCharts:
                     height=300
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
         except Exception as e:
             print(f"Error in simple vehicles per org chart: {e}")
             return None
@@ -178,7 +177,7 @@ class SimpleCharts:
                     height=300
                 )
                 
-                return json.dumps(fig, cls=PlotlyJSONEncoder)
+                return dumps_figure(fig)
         except Exception as e:
             print(f"Error in simple revenue chart: {e}")
             return None
\ No newline at end of file
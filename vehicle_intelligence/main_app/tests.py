@@ -1,3 +1,153 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+import json
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from .api_views import update_parking_exit
+from .models import Organization, CustomUser, ParkingRecord, OrganizationAnalyticsRollup, OrganizationPlateVisits
+from .signals import ANALYTICS_VERSION_CACHE_KEY, ORG_USER_COUNTS_CACHE_KEY
 
-# Create your tests here.
+
+def make_record(**overrides):
+    """Create a parking record with sensible defaults"""
+    fields = {
+        'plate_number': 'KAA123A',
+        'entry_time': timezone.now(),
+        'vehicle_type': 'Car',
+        'plate_color': 'White',
+        'vehicle_brand': 'Toyota',
+        'amount_paid': Decimal('0'),
+        'payment_method': 'Cash',
+        'organization': 'JKIA',
+        'parking_status': 'active',
+    }
+    fields.update(overrides)
+    return ParkingRecord.objects.create(**fields)
+
+
+class CloseParkingSessionTests(TestCase):
+    """update_parking_exit closes the open session and keeps the rollup in step"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        cache.clear()
+
+    def post_exit(self, payload):
+        request = self.factory.post('/api/parking/exit/', json.dumps(payload), content_type='application/json')
+        return update_parking_exit(request)
+
+    def test_closes_latest_active_session(self):
+        older = make_record(entry_time=timezone.now() - timedelta(hours=3), parking_status='completed')
+        record = make_record(entry_time=timezone.now() - timedelta(hours=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_exit({'plate_number': 'KAA123A', 'amount_paid': 300, 'payment_method': 'M-Pesa'})
+
+        self.assertEqual(response.status_code, 200)
+        record.refresh_from_db()
+        self.assertEqual(record.parking_status, 'completed')
+        self.assertEqual(record.amount_paid, Decimal('300'))
+        self.assertEqual(record.payment_method, 'M-Pesa')
+        self.assertIsNotNone(record.exit_time)
+        self.assertGreaterEqual(record.parking_duration_minutes, 59)
+        older.refresh_from_db()
+        self.assertEqual(older.amount_paid, Decimal('0'))
+
+    def test_applies_amount_to_rollup_and_bumps_cache_after_commit(self):
+        make_record(amount_paid=Decimal('50'), parking_status='completed')
+        make_record(entry_time=timezone.now() - timedelta(minutes=30))
+        version = cache.get(ANALYTICS_VERSION_CACHE_KEY, 0)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.post_exit({'plate_number': 'KAA123A', 'amount_paid': 200})
+            # Nothing is invalidated until the transaction commits
+            self.assertEqual(cache.get(ANALYTICS_VERSION_CACHE_KEY, 0), version)
+        for callback in callbacks:
+            callback()
+
+        rollup = OrganizationAnalyticsRollup.objects.get(organization='JKIA')
+        self.assertEqual(rollup.total_revenue, Decimal('250'))
+        self.assertEqual(rollup.record_count, 2)
+        self.assertGreater(cache.get(ANALYTICS_VERSION_CACHE_KEY, 0), version)
+
+    def test_no_active_session_returns_404(self):
+        make_record(parking_status='completed')
+
+        response = self.post_exit({'plate_number': 'KAA123A', 'amount_paid': 100})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(OrganizationAnalyticsRollup.objects.get(organization='JKIA').total_revenue, Decimal('0'))
+
+
+class RollupDeltaTests(TestCase):
+    """Saving and deleting parking records keeps the organization rollups in step"""
+
+    def rollup(self, organization='JKIA'):
+        return OrganizationAnalyticsRollup.objects.get(organization=organization)
+
+    def test_create_adds_record(self):
+        make_record(amount_paid=Decimal('100'), duration_minutes=30)
+        make_record(amount_paid=Decimal('50'), entry_time=timezone.now() - timedelta(days=1))
+        make_record(plate_number='KBB456B', amount_paid=Decimal('20'))
+
+        rollup = self.rollup()
+        self.assertEqual(rollup.record_count, 3)
+        self.assertEqual(rollup.vehicle_count, 2)
+        self.assertEqual(rollup.total_revenue, Decimal('170'))
+        self.assertEqual(rollup.total_duration_minutes, 30)
+        self.assertEqual(rollup.duration_count, 1)
+
+    def test_update_applies_only_the_difference(self):
+        record = make_record(amount_paid=Decimal('100'))
+
+        record.amount_paid = Decimal('250')
+        record.duration_minutes = 45
+        record.save()
+
+        rollup = self.rollup()
+        self.assertEqual(rollup.record_count, 1)
+        self.assertEqual(rollup.vehicle_count, 1)
+        self.assertEqual(rollup.total_revenue, Decimal('250'))
+        self.assertEqual(rollup.total_duration_minutes, 45)
+        self.assertEqual(rollup.duration_count, 1)
+
+    def test_update_moves_contribution_between_organizations(self):
+        record = make_record(amount_paid=Decimal('100'))
+
+        record.organization = 'Sarit Centre'
+        record.save()
+
+        old, new = self.rollup(), self.rollup('Sarit Centre')
+        self.assertEqual((old.record_count, old.vehicle_count, old.total_revenue), (0, 0, Decimal('0')))
+        self.assertEqual((new.record_count, new.vehicle_count, new.total_revenue), (1, 1, Decimal('100')))
+
+    def test_delete_removes_record(self):
+        first = make_record(amount_paid=Decimal('100'))
+        second = make_record(amount_paid=Decimal('40'), entry_time=timezone.now() - timedelta(days=1))
+
+        second.delete()
+        rollup = self.rollup()
+        self.assertEqual((rollup.record_count, rollup.vehicle_count, rollup.total_revenue), (1, 1, Decimal('100')))
+
+        first.delete()
+        rollup = self.rollup()
+        self.assertEqual((rollup.record_count, rollup.vehicle_count, rollup.total_revenue), (0, 0, Decimal('0')))
+        self.assertEqual(OrganizationPlateVisits.objects.get(organization='JKIA', plate_number='KAA123A').visits, 0)
+
+
+class UserCountInvalidationTests(TestCase):
+    """Cached per-organization user counts are dropped when their users change"""
+
+    def test_moving_a_user_clears_both_organizations(self):
+        first = Organization.objects.create(name='JKIA', slug='jkia', email='admin@jkia.com')
+        second = Organization.objects.create(name='Sarit Centre', slug='sarit-centre', email='admin@saritcentre.com')
+        user = CustomUser.objects.create_user('driver', 'driver@jkia.com', 'secret', organization=first)
+        cache.set(ORG_USER_COUNTS_CACHE_KEY.format(first.id), {'total': 1, 'active': 1})
+        cache.set(ORG_USER_COUNTS_CACHE_KEY.format(second.id), {'total': 0, 'active': 0})
+
+        user.organization = second
+        user.save()
+
+        self.assertIsNone(cache.get(ORG_USER_COUNTS_CACHE_KEY.format(first.id)))
+        self.assertIsNone(cache.get(ORG_USER_COUNTS_CACHE_KEY.format(second.id)))
@@ -70,6 +70,7 @@ urlpatterns = [
     
     # AI Assistant API Endpoints
     path('api/ai-chat/', ai_views.ai_chat_endpoint, name='ai_chat_endpoint'),
+    path('api/ai-chat/stream/', ai_views.ai_chat_stream_endpoint, name='ai_chat_stream_endpoint'),
     path('api/ai-report/', ai_views.ai_report_endpoint, name='ai_report_endpoint'),
     path('api/ai-suggestions/', ai_views.ai_suggestions_endpoint, name='ai_suggestions_endpoint'),
     
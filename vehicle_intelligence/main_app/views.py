@@ -7,8 +7,9 @@ from django.utils import timezone
 from django.views.decorators.http import require_POST, require_GET
 from django.core.paginator import Paginator
 from django.db.models import Q, Count
+from django.db import connection, transaction
 import json
-from .models import Organization, ActivityLog, CustomUser, InventoryItem
+from .models import Organization, ActivityLog, CustomUser, InventoryItem, Vehicle, ParkingRecord
 import secrets
 import string
 from .models import UserProfile, Document, Notification, ActivityLog, ProfileAuditLog
@@ -226,7 +227,6 @@ def vehicle_dashboard(request):
     vehicle_data = None
     
     try:
-        from django.db import connection
         
         with connection.cursor() as cursor:
             # Get vehicle analytics from real_movement_analytics
@@ -389,7 +389,6 @@ def super_admin_dashboard(request):
         pass
     
     # Get system statistics - organizations from combined_dataset, users from CustomUser
-    from django.db import connection
     
     # Get organizations from combined_dataset table (actual data source) - only active ones
     total_organizations = 0
@@ -434,7 +433,7 @@ def super_admin_dashboard(request):
     # Get recent system activities (only super admins and organization admins)
     recent_system_activities = ActivityLog.objects.filter(
         user__role__in=['super_admin', 'organization_admin']
-    ).order_by('-timestamp')[:15]
+    ).select_related('user').order_by('-timestamp')[:15]
     
     # Get recent organizations created (from Organization model for display - only active)
     recent_organizations = Organization.objects.filter(is_active=True).order_by('-created_at')[:10]
@@ -476,20 +475,16 @@ def super_admin_organizations_view(request):
         messages.error(request, "You don't have permission to access this page.")
         return redirect('dashboard')
     
-    from .models import Vehicle
-    from django.db.models import Count
     
     organizations = Organization.objects.filter(is_active=True).order_by('-created_at')
     
-    # Add vehicle count for each organization from combined_dataset
-    from django.db import connection
+    # Add vehicle count for each organization from its parking records
+    vehicle_counts = dict(
+        ParkingRecord.objects.filter(organization__in=[org.name for org in organizations])
+        .order_by().values_list('organization').annotate(vehicle_count=Count('plate_number', distinct=True))
+    )
     for org in organizations:
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute('SELECT COUNT(DISTINCT "Plate Number") FROM combined_dataset WHERE "Organization" = %s', [org.name])
-                org.vehicle_count = cursor.fetchone()[0] or 0
-        except Exception:
-            org.vehicle_count = 0
+        org.vehicle_count = vehicle_counts.get(org.name, 0)
     
     context = {
         'user_role': user_role,
@@ -555,7 +550,7 @@ def super_admin_activities_view(request):
     # Get activities for super admins and organization admins only
     activities = ActivityLog.objects.filter(
         user__role__in=['super_admin', 'organization_admin']
-    ).order_by('-timestamp')[:50]
+    ).select_related('user').order_by('-timestamp')[:50]
     
     context = {
         'user_role': user_role,
@@ -590,7 +585,6 @@ def vehicle_alert(request):
     
     if search_query:
         try:
-            from django.db import connection
             
             # Search in real_movement_analytics table
             with connection.cursor() as cursor:
@@ -1383,9 +1377,8 @@ def org_admin_dashboard(request):
     ).count()
     
     # Add analytics data for organization
-    from .real_analytics import RealAnalytics
+    from .real_analytics import RealAnalytics, run_concurrently
     from .org_analytics import OrgAnalytics
-    from django.db import connection
     
     # Get organization name first
     org_name = organization.name if organization else None
@@ -1443,32 +1436,32 @@ def org_admin_dashboard(request):
     org_vehicle_brand_performance_chart = None
     org_seasonal_patterns_chart = None
     
-    # Get filter options for the organization
-    filter_options = OrgAnalytics.get_filter_options(org_name) if org_name else {}
-    
-    # Get applied filters from request
-    applied_filters = {
-        'month': request.GET.get('month'),
-        'vehicle_type': request.GET.get('vehicle_type'),
-        'vehicle_brand': request.GET.get('vehicle_brand'),
-        'payment_method': request.GET.get('payment_method'),
-        'plate_color': request.GET.get('plate_color'),
-        'year': request.GET.get('year')
-    }
-    # Remove None values
-    applied_filters = {k: v for k, v in applied_filters.items() if v}
     if has_vehicle_data and org_name:
-        org_parking_duration_chart = OrgAnalytics.get_org_parking_duration_analysis(org_name, applied_filters)
-        org_hourly_entries_chart = OrgAnalytics.get_org_hourly_entries_chart(org_name, applied_filters)
-        org_vehicles_count_chart = OrgAnalytics.get_org_vehicles_count_chart(org_name, applied_filters)
-        org_revenue_analysis_chart = OrgAnalytics.get_org_revenue_analysis_chart(org_name, applied_filters)
-        org_avg_stay_by_type_chart = OrgAnalytics.get_org_avg_stay_by_type_chart(org_name, applied_filters)
-        org_capacity_utilization_chart = OrgAnalytics.get_org_capacity_utilization_chart(org_name, applied_filters)
-        org_customer_loyalty_chart = OrgAnalytics.get_org_customer_loyalty_chart(org_name, applied_filters)
-        org_revenue_trends_chart = OrgAnalytics.get_org_revenue_trends_chart(org_name, applied_filters)
-        org_payment_behavior_chart = OrgAnalytics.get_org_payment_behavior_chart(org_name, applied_filters)
-        org_vehicle_brand_performance_chart = OrgAnalytics.get_org_vehicle_brand_performance_chart(org_name)
-        org_seasonal_patterns_chart = OrgAnalytics.get_org_seasonal_patterns_chart(org_name)
+        # Each chart is one independent query, so a few are built at a time
+        org_charts = run_concurrently({
+            'parking_duration': lambda: OrgAnalytics.get_org_parking_duration_analysis(org_name, applied_filters),
+            'hourly_entries': lambda: OrgAnalytics.get_org_hourly_entries_chart(org_name, applied_filters),
+            'vehicles_count': lambda: OrgAnalytics.get_org_vehicles_count_chart(org_name, applied_filters),
+            'revenue_analysis': lambda: OrgAnalytics.get_org_revenue_analysis_chart(org_name, applied_filters),
+            'avg_stay_by_type': lambda: OrgAnalytics.get_org_avg_stay_by_type_chart(org_name, applied_filters),
+            'capacity_utilization': lambda: OrgAnalytics.get_org_capacity_utilization_chart(org_name, applied_filters),
+            'customer_loyalty': lambda: OrgAnalytics.get_org_customer_loyalty_chart(org_name, applied_filters),
+            'revenue_trends': lambda: OrgAnalytics.get_org_revenue_trends_chart(org_name, applied_filters),
+            'payment_behavior': lambda: OrgAnalytics.get_org_payment_behavior_chart(org_name, applied_filters),
+            'vehicle_brand_performance': lambda: OrgAnalytics.get_org_vehicle_brand_performance_chart(org_name),
+            'seasonal_patterns': lambda: OrgAnalytics.get_org_seasonal_patterns_chart(org_name),
+        })
+        org_parking_duration_chart = org_charts['parking_duration']
+        org_hourly_entries_chart = org_charts['hourly_entries']
+        org_vehicles_count_chart = org_charts['vehicles_count']
+        org_revenue_analysis_chart = org_charts['revenue_analysis']
+        org_avg_stay_by_type_chart = org_charts['avg_stay_by_type']
+        org_capacity_utilization_chart = org_charts['capacity_utilization']
+        org_customer_loyalty_chart = org_charts['customer_loyalty']
+        org_revenue_trends_chart = org_charts['revenue_trends']
+        org_payment_behavior_chart = org_charts['payment_behavior']
+        org_vehicle_brand_performance_chart = org_charts['vehicle_brand_performance']
+        org_seasonal_patterns_chart = org_charts['seasonal_patterns']
     
     context = {
         'organization': organization,
@@ -1753,9 +1746,7 @@ def analytics(request):
         messages.error(request, "You don't have permission to access this page.")
         return redirect('dashboard')
     
-    from .real_analytics import RealAnalytics
-    from .models import Organization
-    from django.db import connection
+    from .real_analytics import RealAnalytics, run_concurrently
     
     # Get selected filters from request
     selected_org_id = request.GET.get('organization')
@@ -1793,13 +1784,25 @@ def analytics(request):
     org_name = selected_organization.name if selected_organization else None
     
     # Get chart data using RealAnalytics with proper organization filtering
-    fleet_summary = RealAnalytics.get_fleet_summary(org_name)
-    parking_duration_chart = RealAnalytics.get_parking_duration_analysis(org_name)
-    hourly_entries_chart = RealAnalytics.get_hourly_entries_chart(org_name)
-    vehicles_per_site_chart = RealAnalytics.get_vehicles_per_organization_chart()
-    revenue_per_site_chart = RealAnalytics.get_revenue_per_organization_chart()
-    visit_patterns_chart = RealAnalytics.get_visit_patterns_chart(org_name)
-    avg_stay_by_type_chart = RealAnalytics.get_avg_stay_by_type_chart(org_name)
+    # Each chart is one independent query, so a few are built at a time
+    chart_calls = {
+        'fleet_summary': lambda: RealAnalytics.get_fleet_summary(org_name),
+        'parking_duration_chart': lambda: RealAnalytics.get_parking_duration_analysis(org_name),
+        'hourly_entries_chart': lambda: RealAnalytics.get_hourly_entries_chart(org_name),
+        'vehicles_per_site_chart': RealAnalytics.get_vehicles_per_organization_chart,
+        'revenue_per_site_chart': RealAnalytics.get_revenue_per_organization_chart,
+        'visit_patterns_chart': lambda: RealAnalytics.get_visit_patterns_chart(org_name),
+        'avg_stay_by_type_chart': lambda: RealAnalytics.get_avg_stay_by_type_chart(org_name),
+    }
+    
+    charts = run_concurrently(chart_calls)
+    fleet_summary = charts['fleet_summary']
+    parking_duration_chart = charts['parking_duration_chart']
+    hourly_entries_chart = charts['hourly_entries_chart']
+    vehicles_per_site_chart = charts['vehicles_per_site_chart']
+    revenue_per_site_chart = charts['revenue_per_site_chart']
+    visit_patterns_chart = charts['visit_patterns_chart']
+    avg_stay_by_type_chart = charts['avg_stay_by_type_chart']
     
     # Additional comprehensive charts for super admin
     capacity_utilization_chart = None
@@ -2145,38 +2148,44 @@ def hr_dashboard(request):
     
     # Super admins see all data, others see only their organization
     if request.user.role == 'super_admin' or request.user.is_superuser:
-        all_users = CustomUser.objects.all()
+        all_users = CustomUser.objects.all().select_related('organization')
         all_organizations = Organization.objects.all()
         organization = None
     else:
         organization = request.user.organization
-        all_users = CustomUser.objects.filter(organization=organization)
+        all_users = CustomUser.objects.filter(organization=organization).select_related('organization')
         all_organizations = Organization.objects.filter(id=organization.id) if organization else Organization.objects.none()
     
     # HR Statistics
-    total_employees = all_users.count()
-    active_employees = all_users.filter(is_active=True).count()
+    employee_totals = all_users.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True))
+    )
+    total_employees = employee_totals['total']
+    active_employees = employee_totals['active']
     inactive_employees = total_employees - active_employees
     
     # Role distribution
+    role_counts = dict(all_users.values_list('role').annotate(count=Count('id')).order_by())
     role_stats = {}
     for role_code, role_name in CustomUser.ROLE_CHOICES:
-        count = all_users.filter(role=role_code).count()
+        count = role_counts.get(role_code, 0)
         if count > 0:
             role_stats[role_name] = count
     
     # Department distribution
-    dept_stats = {}
-    departments = all_users.exclude(department__isnull=True).exclude(department='').values_list('department', flat=True).distinct()
-    for dept in departments:
-        count = all_users.filter(department=dept).count()
-        dept_stats[dept] = count
+    dept_stats = dict(
+        all_users.exclude(department__isnull=True).exclude(department='')
+        .values_list('department').annotate(count=Count('id')).order_by('department')
+    )
     
     # Organization statistics
+    org_user_counts = dict(
+        all_users.values_list('organization').annotate(count=Count('id')).order_by()
+    )
     org_stats = {}
     for org in all_organizations:
-        user_count = all_users.filter(organization=org).count()
-        org_stats[org.name] = user_count
+        org_stats[org.name] = org_user_counts.get(org.id, 0)
     
     # Recent hires (last 30 days)
     thirty_days_ago = timezone.now() - timedelta(days=30)
@@ -2190,27 +2199,28 @@ def hr_dashboard(request):
     profile_completion_rate = (users_with_profiles / total_employees * 100) if total_employees > 0 else 0
     
     # Document statistics
-    if organization:
-        total_documents = Document.objects.filter(user__organization=organization).count()
-        verified_documents = Document.objects.filter(user__organization=organization, is_verified=True).count()
-    else:
-        total_documents = Document.objects.count()
-        verified_documents = Document.objects.filter(is_verified=True).count()
+    documents = Document.objects.filter(user__organization=organization) if organization else Document.objects.all()
+    document_totals = documents.aggregate(
+        total=Count('id'),
+        verified=Count('id', filter=Q(is_verified=True))
+    )
+    total_documents = document_totals['total']
+    verified_documents = document_totals['verified']
     
     # Recent activities (HR related)
     if organization:
         recent_activities = ActivityLog.objects.filter(
             organization=organization,
             module__in=['profile', 'user_management', 'hr_dashboard']
-        ).order_by('-timestamp')[:15]
+        ).select_related('user').order_by('-timestamp')[:15]
     else:
         recent_activities = ActivityLog.objects.filter(
             module__in=['profile', 'user_management', 'hr_dashboard']
-        ).order_by('-timestamp')[:15]
+        ).select_related('user').order_by('-timestamp')[:15]
     
     # Users needing attention
     users_needing_attention = []
-    for user in all_users[:20]:
+    for user in all_users.select_related('profile')[:20]:
         issues = []
         profile = getattr(user, 'profile', None)
         
@@ -2541,8 +2551,11 @@ def export_hr_csv(users, organizations):
     writer.writerow(['ORGANIZATIONS REPORT'])
     writer.writerow(['Organization Name', 'Email', 'Phone', 'Status', 'Created Date', 'Total Users'])
     
+    org_user_counts = dict(
+        users.values_list('organization').annotate(count=Count('id')).order_by()
+    )
     for org in organizations:
-        user_count = users.filter(organization=org).count()
+        user_count = org_user_counts.get(org.id, 0)
         writer.writerow([
             org.name,
             org.email,
@@ -2600,8 +2613,11 @@ def export_hr_pdf(users, organizations):
     story.append(Paragraph('Organizations Overview', styles['Heading2']))
     
     org_data = [['Organization', 'Email', 'Status', 'Users', 'Created']]
+    org_user_counts = dict(
+        users.values_list('organization').annotate(count=Count('id')).order_by()
+    )
     for org in organizations:
-        user_count = users.filter(organization=org).count()
+        user_count = org_user_counts.get(org.id, 0)
         org_data.append([
             org.name,
             org.email,
@@ -3011,7 +3027,6 @@ def profile_view(request):
     
     # If profile doesn't exist, create it
     if not profile:
-        from django.db import transaction
         with transaction.atomic():
             profile = UserProfile.objects.create(user=user)
             ActivityLog.objects.create(
@@ -3567,7 +3582,6 @@ def vehicle_analytics_api(request):
         return JsonResponse({'success': False, 'error': 'License plate number is required'}, status=400)
     
     try:
-        from django.db import connection
         from datetime import datetime
         
         # Get user's organization for filtering
@@ -3748,7 +3762,6 @@ def export_analytics_report(request):
         return JsonResponse({'error': 'Permission denied'}, status=403)
     
     from .analytics import VehicleAnalytics
-    from .models import Vehicle, Organization
     
     # Get selected filters
     selected_org_id = request.GET.get('organization')
@@ -3770,7 +3783,7 @@ def export_analytics_report(request):
     
     # Get all analytics data
     fleet_summary = analytics_engine.get_fleet_summary()
-    driver_performance = analytics_engine.get_driver_performance()[:10]
+    driver_performance = analytics_engine.get_driver_performance(limit=10)
     route_analysis = analytics_engine.get_route_analysis()[:10]
     cost_analysis = analytics_engine.get_cost_analysis()
     
@@ -3950,7 +3963,6 @@ def vehicle_daily_movement_api(request):
         return JsonResponse({'success': False, 'error': 'License plate number is required'}, status=400)
     
     try:
-        from django.db import connection
         from datetime import datetime, date
         
         # Use today's date if no date provided
@@ -42,6 +42,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'main_app.middleware.RoleBasedAccessMiddleware',
+    'main_app.middleware.RequestClockMiddleware',
 ]
 
 ROOT_URLCONF = 'vehicle_intelligence.urls'
@@ -73,6 +74,25 @@ DATABASES = {
         'PASSWORD': '2000',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Reuse connections across requests instead of reconnecting per request
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Small per-process tier in front of the shared cache for hot analytics keys
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'analytics-local',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1024,
+        }
     }
 }
 
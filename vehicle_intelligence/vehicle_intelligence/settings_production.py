@@ -37,8 +37,17 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Database optimization settings
-DATABASES['default']['CONN_MAX_AGE'] = 600
-DATABASES['default']['OPTIONS']['MAX_CONNS'] = 20
+# Connections come from a psycopg pool shared by the ASGI workers' threads;
+# Django's pool cannot be combined with persistent connections (CONN_MAX_AGE)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+DATABASES['default']['OPTIONS']['pool'] = {
+    'min_size': 4,
+    'max_size': 20,
+}
+# Bind parameters server-side so psycopg can prepare the repeated dashboard
+# aggregates; a statement is prepared on a pooled connection after two runs
+DATABASES['default']['OPTIONS']['server_side_binding'] = True
+DATABASES['default']['OPTIONS']['prepare_threshold'] = 2
 
 # Cache configuration for faster data loading
 CACHES = {
@@ -49,6 +58,15 @@ CACHES = {
         'OPTIONS': {
             'MAX_ENTRIES': 1000,
         }
+    },
+    # Small per-process tier in front of the shared cache for hot analytics keys
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'analytics-local',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1024,
+        }
     }
 }
 